@@ -2,12 +2,22 @@ from langgraph.graph import StateGraph, END
 from typing import TypedDict, Optional
 import asyncio
 import json
+import logging
 
-from pymupdf import message
-from app.llm import get_medical_response
+from app.llm import aget_medical_response, aload_history, atry_fast_path, discard_future
+from app.llm_scheduler import PRIORITY_NORMAL, guess_priority
+from app.persistence import write_queue
 from app.mcp_client import MCPClient
+from app.matching import PhraseMatcher
+from app.telemetry import span, traced_node
 import os
 
+logger = logging.getLogger(__name__)
+
+
+MCP_SERVER_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "mcp_server", "server.py")
+)
 
 # -------------------------
 # State Definition
@@ -17,18 +27,65 @@ class MedicalState(TypedDict):
     session_id: str
     message: str
     city: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
     rag: object
+    mcp_pool: Optional[object]
+    intent_classifier: Optional[object]
+    session_context: Optional[dict]
+    retrieval: Optional[object]
+    hospital_prefetch: Optional[object]
     llm_output: dict
     hospital_info: Optional[dict]
     final_output: dict
 
 
+# -------------------------
+# Node 0: Intent Fast-Path
+# -------------------------
+
+@traced_node("intent_node")
+async def intent_node(state: MedicalState):
+    classifier = state.get("intent_classifier")
+    if classifier is None or asking_for_facility(state["message"]):
+        return state
+
+    recent_messages, _ = await aload_history(state["session_id"], state.get("session_context"))
+    if guess_priority(state["message"], recent_messages) != PRIORITY_NORMAL:
+        # Possibly urgent ("can't breathe"): never answer from a template.
+        return state
+
+    result = await atry_fast_path(classifier, state["message"], recent_messages)
+
+    if result is not None:
+        discard_future(state.get("retrieval"))
+        write_queue.save_turn(state["session_id"], state["message"], result)
+        state["llm_output"] = result
+
+    return state
+
+
+def intent_router(state: MedicalState):
+    return "final_node" if state.get("llm_output") else "medical_node"
+
+
 # -------------------------
 # Node 1: Medical Reasoning
 # -------------------------
 
-def medical_reasoning_node(state: MedicalState):
-    result = get_medical_response(state["message"], state["session_id"],rag=state["rag"])
+@traced_node("medical_node")
+async def medical_reasoning_node(state: MedicalState):
+    # The router will want a hospital whatever the model says; start the
+    # lookup now so it overlaps the LLM call.
+    start_hospital_prefetch(state)
+
+    result = await aget_medical_response(
+        state["message"],
+        state["session_id"],
+        rag=state["rag"],
+        context=state.get("session_context"),
+        retrieval=state.get("retrieval")
+    )
     state["llm_output"] = result
     return state
 
@@ -37,37 +94,51 @@ def medical_reasoning_node(state: MedicalState):
 # Node 2: Router
 # -------------------------
 
-def router_node(state: MedicalState):
+FACILITY_KEYWORDS = [
+    "hospital",
+    "clinic",
+    "medical facility",
+    "where should i go",
+    "which hospital",
+    "recommend hospital",
+    "which doctor",
+    "who should i consult",
+    "which clinic",
+    "where can i go",
+    "nearby hospital",
+    "doctor",
+    "hospitals",
+    "clinics",
+    "medical facilities",
+    "doctors",
+]
+
+FACILITY_MATCHER = PhraseMatcher.from_phrases(FACILITY_KEYWORDS)
+
+
+def asking_for_facility(message: str) -> bool:
+    return FACILITY_MATCHER.contains(message)
+
+
+def has_location(state: MedicalState) -> bool:
+    return bool(state.get("city")) or (
+        state.get("latitude") is not None and state.get("longitude") is not None
+    )
 
-    message = state["message"].lower()
-    severity = state["llm_output"].get("severity_level")
 
-    facility_keywords = [
-        "hospital",
-        "clinic",
-        "medical facility",
-        "where should i go",
-        "which hospital",
-        "recommend hospital",
-        "which doctor",
-        "who should i consult",
-        "which clinic",
-        "where can i go",
-        "nearby hospital",
-        "doctor"
-    ]
+def router_node(state: MedicalState):
 
-    asking_for_facility = any(keyword in message for keyword in facility_keywords)
+    severity = state["llm_output"].get("severity_level")
 
     # 🔥 PRIORITY 1: Explicit hospital intent
-    if asking_for_facility:
-        if not state.get("city"):
+    if asking_for_facility(state["message"]):
+        if not has_location(state):
             return "clarification_node"
         return "hospital_node"
 
     # 🔥 PRIORITY 2: Emergency cases
     if severity in ["high", "emergency"]:
-        if not state.get("city"):
+        if not has_location(state):
             return "clarification_node"
         return "hospital_node"
 
@@ -79,8 +150,11 @@ def router_node(state: MedicalState):
 # -------------------------
 # Node 3: Clarification Node
 # -------------------------
+@traced_node("clarification_node")
 def clarification_node(state: MedicalState):
 
+    discard_hospital_prefetch(state)
+
     state["final_output"] = (
     "To recommend nearby hospitals or specialists, I need to know your city. "
     "Please tell me which city you are currently in."
@@ -93,46 +167,132 @@ def clarification_node(state: MedicalState):
 # Node 4: Hospital Tool Node
 # -------------------------
 
-async def hospital_node(state: MedicalState):
+def hospital_arguments(state: MedicalState, severity_level=None, specialist_type=None) -> dict:
+    arguments = {
+        "city": state["city"],
+        "severity_level": severity_level,
+        "specialist_type": specialist_type
+    }
 
-    server_path = os.path.abspath(
-        os.path.join(os.path.dirname(__file__), "..", "mcp_server", "server.py")
-    )
+    # With coordinates the server ranks nearby hospitals by distance.
+    if state.get("latitude") is not None and state.get("longitude") is not None:
+        arguments["latitude"] = state["latitude"]
+        arguments["longitude"] = state["longitude"]
 
-    mcp = MCPClient(server_path)
-    try:
-        await mcp.connect()
+    return arguments
 
-        specialist_list = state["llm_output"].get("recommended_specialists", [])
-        specialist_type = specialist_list[0] if specialist_list else None
 
-        tool_result = await mcp.call_tool(
-            "recommend_hospital_tool",
-            {
-                "city": state["city"],
-                "severity_level": state["llm_output"].get("severity_level"),
-                "specialist_type": specialist_type
-            }
-        )
+async def fetch_hospital(state: MedicalState, arguments: dict) -> dict:
 
+    mcp_pool = state.get("mcp_pool")
 
-    finally:
-        await mcp.close()
+    try:
+        with span("hospital_lookup"):
+            if mcp_pool is not None:
+                tool_result = await mcp_pool.call_tool("recommend_hospital_tool", arguments)
+            else:
+                # No pool (e.g. scripts/tests): fall back to a one-off server process.
+                mcp = MCPClient(MCP_SERVER_PATH)
+                try:
+                    await mcp.connect()
+                    tool_result = await mcp.call_tool("recommend_hospital_tool", arguments)
+                finally:
+                    await mcp.close()
+    except Exception as e:
+        logger.warning("Hospital lookup failed", extra={"error": str(e)})
+        return {"error": "Hospital lookup failed"}
 
     if tool_result and tool_result.content:
         raw_text = tool_result.content[0].text.strip()
 
         if raw_text:
             try:
-                hospital_data = json.loads(raw_text)
-                state["hospital_info"] = hospital_data
+                return json.loads(raw_text)
             except json.JSONDecodeError:
-                state["hospital_info"] = {"error": "Invalid hospital data"}
-        else:
-            state["hospital_info"] = {"error": "Empty hospital response"}
-    else:
-        state["hospital_info"] = {"error": "No hospital data returned"}
+                return {"error": "Invalid hospital data"}
+        return {"error": "Empty hospital response"}
+
+    return {"error": "No hospital data returned"}
+
+
+# -------------------------
+# Speculative Hospital Prefetch
+# -------------------------
+
+def start_hospital_prefetch(state: MedicalState):
+    """
+    When the message already asks for a facility and the location is known,
+    router_node will pick hospital_node regardless of the model output, so
+    look up the default recommendation (no severity / specialist) while the
+    model runs. Only with a session pool: no speculative server processes.
+    """
+    if state.get("mcp_pool") is None:
+        return
+    if not asking_for_facility(state["message"]) or not has_location(state):
+        return
+
+    state["hospital_prefetch"] = asyncio.ensure_future(
+        fetch_hospital(state, hospital_arguments(state))
+    )
+
+
+def discard_hospital_prefetch(state: MedicalState):
+    # Dropped rather than cancelled: the pooled MCP session stays in use
+    # until the server answers, and fetch_hospital never raises.
+    state["hospital_prefetch"] = None
+
+
+def prefetch_matches(hospital: dict, arguments: dict) -> bool:
+    """
+    True when the default recommendation is also what the real arguments
+    would return, so the real lookup can be skipped.
+
+    City lookups return the first hospital in the list that fits: the
+    default (first) one is the answer if it has the emergency department an
+    emergency needs, or otherwise the requested specialty. Location lookups
+    rank by distance plus capability penalties: the nearest hospital is the
+    answer if it carries no penalty.
+    """
+    if not hospital or "error" in hospital:
+        return False
+
+    severity = (arguments.get("severity_level") or "").lower()
+    specialist = arguments.get("specialist_type")
+    specialties = {specialty.lower() for specialty in hospital.get("specialties", [])}
+    has_specialist = not specialist or specialist.strip().lower() in specialties
+
+    if "latitude" in arguments:
+        needs_emergency = severity in ("high", "emergency")
+        return has_specialist and (not needs_emergency or bool(hospital.get("emergency_available")))
+
+    if severity == "emergency":
+        return bool(hospital.get("emergency_available"))
+
+    return has_specialist
+
+
+@traced_node("hospital_node")
+async def hospital_node(state: MedicalState):
+
+    specialist_list = state["llm_output"].get("recommended_specialists", [])
+    specialist_type = specialist_list[0] if specialist_list else None
+
+    arguments = hospital_arguments(
+        state,
+        severity_level=state["llm_output"].get("severity_level"),
+        specialist_type=specialist_type
+    )
+
+    prefetch = state.get("hospital_prefetch")
+    state["hospital_prefetch"] = None
+
+    if prefetch is not None:
+        hospital = await prefetch
+        if prefetch_matches(hospital, arguments):
+            state["hospital_info"] = hospital
+            return state
 
+    state["hospital_info"] = await fetch_hospital(state, arguments)
 
     return state
 
@@ -141,75 +301,129 @@ async def hospital_node(state: MedicalState):
 # Node 5: Final Node
 # -------------------------
 
-def final_node(state: MedicalState):
+# Each renderer turns one field of the model JSON into message lines.
+# final_node stitches them together; the streaming endpoint emits them
+# one by one as soon as the corresponding field has been generated.
 
-    data = state["llm_output"]
+DISCLAIMER = "\n\nThis information is educational and not a substitute for professional medical advice."
 
-    if "error" in data:
-        state["final_output"] = "I'm sorry, something went wrong while processing your request."
-        return state
 
-    severity = data.get("severity_level", "low")
-    conditions = data.get("possible_conditions", [])
-    precautions = data.get("precautions", [])
-    next_steps = data.get("next_steps", [])
-    red_flags = data.get("red_flags", [])
-    followups = data.get("follow_up_questions", [])
+def render_severity_section(data: dict):
+    # 🔴 Emergency tone
+    if data.get("severity_level", "low") in ["emergency", "high"]:
+        return ["⚠️ Your symptoms may require urgent medical attention.\n"]
+    return []
 
-    message_parts = []
 
-    # 🔴 Emergency tone
-    if severity in ["emergency", "high"]:
-        message_parts.append("⚠️ Your symptoms may require urgent medical attention.\n")
+def render_reply_section(data: dict):
+    # 💬 Templated reply (intent fast-path)
+    reply = data.get("reply")
+    return [reply] if reply else []
+
+
+def render_condition_section(data: dict):
+    conditions = data.get("possible_conditions", [])
+    if not conditions:
+        return []
 
     # 🟢 Conditions
-    if conditions:
-        top_condition = conditions[0]
-        message_parts.append(f"Based on your symptoms, one possible condition is **{top_condition['name']}**.\n")
-        message_parts.append(f"{top_condition['reason']}\n")
+    top_condition = conditions[0]
+    return [
+        f"Based on your symptoms, one possible condition is **{top_condition['name']}**.\n",
+        f"{top_condition['reason']}\n",
+    ]
+
+
+def render_next_steps_section(data: dict):
+    next_steps = data.get("next_steps", [])
+    if not next_steps:
+        return []
 
     # 💊 What to do
-    if next_steps:
-        message_parts.append("\nWhat you should do:")
-        for step in next_steps:
-            message_parts.append(f"• {step}")
+    return ["\nWhat you should do:"] + [f"• {step}" for step in next_steps]
+
+
+def render_red_flags_section(data: dict):
+    severity = data.get("severity_level", "low")
+    red_flags = data.get("red_flags", [])
+    if not red_flags or severity not in ["moderate", "high", "emergency"]:
+        return []
 
     # 🛑 Red flags
-    if red_flags and severity in ["moderate", "high", "emergency"]:
-        message_parts.append("\nSeek immediate care if you notice:")
-        for flag in red_flags:
-            message_parts.append(f"• {flag}")
+    return ["\nSeek immediate care if you notice:"] + [f"• {flag}" for flag in red_flags]
+
+
+def render_medications_section(data: dict):
+    conditions = data.get("possible_conditions", [])
+    medications = conditions[0].get("possible_medications", []) if conditions else []
+    if not medications:
+        return []
 
     # 💊 Medications
-    medications = top_condition.get("possible_medications", [])
-    if medications:
-        message_parts.append("\nMedications that may be considered (if appropriate):")
-        for med in medications:
-            message_parts.append(f"• {med}")
+    return ["\nMedications that may be considered (if appropriate):"] + [f"• {med}" for med in medications]
+
+
+def render_precautions_section(data: dict):
+    precautions = data.get("precautions", [])
+    if not precautions:
+        return []
 
     # 🧾 Precautions
-    if precautions:
-        message_parts.append("\nGeneral precautions:")
-        for p in precautions:
-            message_parts.append(f"• {p}")
+    return ["\nGeneral precautions:"] + [f"• {p}" for p in precautions]
 
 
+def render_hospital_section(data: dict, hospital: Optional[dict]):
     # 🏥 Hospital (only if high severity)
-    if severity in ["high", "emergency"] and state.get("hospital_info"):
-        hospital = state["hospital_info"]
-        message_parts.append("\nNearest recommended hospital:")
-        message_parts.append(f"{hospital.get('name')}")
-        message_parts.append(f"{hospital.get('address')}")
-        message_parts.append(f"Contact: {hospital.get('contact')}")
+    if data.get("severity_level", "low") not in ["high", "emergency"] or not hospital:
+        return []
+
+    lines = [
+        "\nNearest recommended hospital:",
+        f"{hospital.get('name')}",
+        f"{hospital.get('address')}",
+        f"Contact: {hospital.get('contact')}",
+    ]
+
+    if hospital.get("distance_km") is not None:
+        lines.append(f"Distance: {hospital['distance_km']} km")
+
+    return lines
+
+
+def render_followup_section(data: dict):
+    severity = data.get("severity_level", "low")
+    followups = data.get("follow_up_questions", [])
+    if severity not in ["low", "moderate"] or not followups:
+        return []
 
     # ❓ Follow up (only if low/moderate)
-    if severity in ["low", "moderate"] and followups:
-        message_parts.append("\nTo better understand your condition:")
-        for q in followups[:2]:
-            message_parts.append(f"• {q}")
+    return ["\nTo better understand your condition:"] + [f"• {q}" for q in followups[:2]]
 
 
-    message_parts.append("\n\nThis information is educational and not a substitute for professional medical advice.")
+@traced_node("final_node")
+def final_node(state: MedicalState):
+
+    # Reached without hospital_node: a speculative lookup is not needed.
+    discard_hospital_prefetch(state)
+
+    data = state["llm_output"]
+
+    if "error" in data:
+        state["final_output"] = "I'm sorry, something went wrong while processing your request."
+        return state
+
+    message_parts = []
+    message_parts += render_severity_section(data)
+    message_parts += render_reply_section(data)
+    message_parts += render_condition_section(data)
+    message_parts += render_next_steps_section(data)
+    message_parts += render_red_flags_section(data)
+    message_parts += render_medications_section(data)
+    message_parts += render_precautions_section(data)
+    message_parts += render_hospital_section(data, state.get("hospital_info"))
+    message_parts += render_followup_section(data)
+
+    message_parts.append(DISCLAIMER)
 
     final_message = "\n".join(message_parts)
 
@@ -223,12 +437,22 @@ def final_node(state: MedicalState):
 
 builder = StateGraph(MedicalState)
 
+builder.add_node("intent_node", intent_node)
 builder.add_node("medical_node", medical_reasoning_node)
 builder.add_node("clarification_node", clarification_node)
 builder.add_node("hospital_node", hospital_node)
 builder.add_node("final_node", final_node)
 
-builder.set_entry_point("medical_node")
+builder.set_entry_point("intent_node")
+
+builder.add_conditional_edges(
+    "intent_node",
+    intent_router,
+    {
+        "medical_node": "medical_node",
+        "final_node": "final_node"
+    }
+)
 
 builder.add_conditional_edges(
     "medical_node",
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app.telemetry import BATCH_SIZE
+
+
+# ---------------------------
+# Micro-Batching
+# ---------------------------
+
+class MicroBatcher:
+    """
+    Groups calls from concurrent threads into batches for `handler`.
+
+    `submit(item)` blocks the calling thread until its result is ready. A
+    background thread takes every waiting item (up to `max_batch`) and calls
+    `handler(items)`, which must return one result per item, in order. An
+    exception from the handler is raised in every caller of that batch.
+
+    Items that queue up while a batch runs form the next batch. When only
+    one item is waiting but the previous batch had company, the thread
+    waits up to `max_wait_ms` for others to join; a lone caller on an idle
+    batcher is never held back.
+    """
+
+    def __init__(self, handler, name: str, max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._last_batch = 0
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+
+        # Whatever is already queued joins without waiting.
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if len(batch) == 1 and self._last_batch > 1 and self.max_wait > 0:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+        self._last_batch = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+
+            try:
+                results = self.handler(items)
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            BATCH_SIZE.observe(len(batch), self.name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+            }
@@ -0,0 +1,164 @@
+import glob
+import os
+import shutil
+import time
+
+import numpy as np
+
+
+# ---------------------------
+# Index Generations
+# ---------------------------
+
+# A build writes every file of the index (FAISS index, its meta, chunk
+# store, BM25 files, manifest) into a new generation directory,
+# "<base>.<generation>/", under the names of the unversioned layout, and
+# publishes it by replacing the one-line pointer "<base>.current". Readers
+# resolve the pointer once and open everything from that directory, so they
+# never mix files from two builds and no file they have mapped is ever
+# rewritten. Without a pointer the unversioned "<base>..." files are used.
+
+def current_generation(base: str):
+    try:
+        with open(f"{base}.current", "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generation_prefix(base: str, generation) -> str:
+    """
+    File prefix of a generation: "<base>.<gen>/<name>", or `base` itself
+    for the unversioned layout (generation None).
+    """
+    if not generation:
+        return base
+    return os.path.join(f"{base}.{generation}", os.path.basename(base))
+
+
+def current_prefix(base: str) -> str:
+    return generation_prefix(base, current_generation(base))
+
+
+def new_generation(base: str) -> str:
+    # Fixed-width hex, so generations sort in creation order.
+    generation = f"{time.time_ns():016x}"
+    os.makedirs(f"{base}.{generation}")
+    return generation
+
+
+def publish_generation(base: str, generation: str, legacy_paths=()):
+    """
+    Point readers at `generation` and delete every other generation except
+    the one it replaces (a reader may have just read the old pointer and not
+    yet opened its files), including unpublished ones left by failed builds.
+    `legacy_paths`, the unversioned files, are removed once they are no
+    longer the replaced generation.
+    """
+    previous = current_generation(base)
+
+    with open(f"{base}.current.tmp", "w") as f:
+        f.write(generation)
+    os.replace(f"{base}.current.tmp", f"{base}.current")
+
+    for path in glob.glob(f"{glob.escape(base)}.*/"):
+        other = os.path.basename(os.path.dirname(path))[len(os.path.basename(base)) + 1:]
+        if other not in (generation, previous):
+            shutil.rmtree(path, ignore_errors=True)
+
+    if previous is not None:
+        for path in legacy_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# ---------------------------
+# Memory-Mapped Chunk Store
+# ---------------------------
+
+_CHUNK_FILES = ("_chunks.bin", "_chunks.ids.npy", "_chunks.offsets.npy")
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped store of chunk texts keyed by vector ID.
+
+    On disk it is three files sharing a prefix, written once into a new
+    index generation (see publish_generation):
+      <prefix>_chunks.ids.npy      sorted int64 chunk IDs
+      <prefix>_chunks.offsets.npy  int64 byte offsets into the blob (len = n + 1)
+      <prefix>_chunks.bin          UTF-8 texts, concatenated
+
+    Nothing is read up front: all three files are mapped and a chunk is
+    decoded only when it is looked up, so worker processes share one copy
+    through the page cache.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.ids = np.load(f"{prefix}_chunks.ids.npy", mmap_mode="r")
+        self.offsets = np.load(f"{prefix}_chunks.offsets.npy", mmap_mode="r")
+
+        if os.path.getsize(f"{prefix}_chunks.bin") > 0:
+            self.blob = np.memmap(f"{prefix}_chunks.bin", dtype=np.uint8, mode="r")
+        else:
+            # np.memmap cannot map an empty file.
+            self.blob = np.empty(0, dtype=np.uint8)
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return all(os.path.exists(f"{prefix}{suffix}") for suffix in _CHUNK_FILES)
+
+    @staticmethod
+    def write(prefix: str, items):
+        """
+        Write (id, text) pairs, which must arrive in ascending ID order.
+        Texts are streamed to disk; `prefix` belongs to a generation that
+        is not published yet, so no reader sees the files half-written.
+        """
+        ids = []
+        offsets = [0]
+
+        with open(f"{prefix}_chunks.bin", "wb") as blob:
+            for chunk_id, text in items:
+                if ids and chunk_id <= ids[-1]:
+                    raise ValueError("ChunkStore.write expects strictly ascending IDs")
+                data = text.encode("utf-8")
+                blob.write(data)
+                ids.append(chunk_id)
+                offsets.append(offsets[-1] + len(data))
+
+        with open(f"{prefix}_chunks.ids.npy", "wb") as f:
+            np.save(f, np.asarray(ids, dtype=np.int64))
+        with open(f"{prefix}_chunks.offsets.npy", "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.int64))
+
+    def _position(self, chunk_id):
+        pos = int(np.searchsorted(self.ids, chunk_id))
+        if pos == len(self.ids) or self.ids[pos] != chunk_id:
+            return None
+        return pos
+
+    def _text_at(self, pos: int) -> str:
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __getitem__(self, chunk_id) -> str:
+        pos = self._position(chunk_id)
+        if pos is None:
+            raise KeyError(chunk_id)
+        return self._text_at(pos)
+
+    def __contains__(self, chunk_id) -> bool:
+        return self._position(chunk_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return (int(chunk_id) for chunk_id in self.ids)
+
+    def items(self):
+        for pos in range(len(self.ids)):
+            yield int(self.ids[pos]), self._text_at(pos)
@@ -6,4 +6,126 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY is not set in environment variables.")
\ No newline at end of file
+    raise ValueError("GROQ_API_KEY is not set in environment variables.")
+
+
+# ---------------------------
+# MCP Session Pool
+# ---------------------------
+
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "10"))
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "20"))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+
+
+# ---------------------------
+# LLM Client
+# ---------------------------
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# Per call to Groq; keep it well under LLM_TIMEOUT so a hung call leaves
+# time for a retry on the fallback model.
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "10"))
+
+# Groq account limits per model (requests and tokens per minute, 0 = no
+# limit); defaults are the free tier. Requests wait in severity order for
+# budget; after LLM_FALLBACK_AFTER seconds they go to LLM_FALLBACK_MODEL.
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_RPM = float(os.getenv("LLM_RPM", "30"))
+LLM_TPM = float(os.getenv("LLM_TPM", "12000"))
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "llama-3.1-8b-instant")
+LLM_FALLBACK_RPM = float(os.getenv("LLM_FALLBACK_RPM", "30"))
+LLM_FALLBACK_TPM = float(os.getenv("LLM_FALLBACK_TPM", "6000"))
+LLM_FALLBACK_AFTER = float(os.getenv("LLM_FALLBACK_AFTER", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+
+# ---------------------------
+# Conversation Summaries
+# ---------------------------
+
+# Sessions longer than this get a rolling summary; the most recent
+# SUMMARY_KEEP_RECENT messages are always sent verbatim instead.
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "12"))
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "2"))
+
+
+# ---------------------------
+# Semantic Response Cache
+# ---------------------------
+
+# Opt-in: serves stored answers to near-identical first-turn messages.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+
+
+# ---------------------------
+# Write-Behind Persistence
+# ---------------------------
+
+# Chat turns and profile updates are committed by a background writer.
+# A write waits at most PERSIST_FLUSH_INTERVAL seconds for others to join
+# its transaction; lower it to shrink the window of unflushed writes.
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.05"))
+PERSIST_MAX_BATCH = int(os.getenv("PERSIST_MAX_BATCH", "256"))
+PERSIST_SHUTDOWN_TIMEOUT = float(os.getenv("PERSIST_SHUTDOWN_TIMEOUT", "10"))
+
+
+# ---------------------------
+# History Retention
+# ---------------------------
+
+# Sessions idle for HISTORY_IDLE_DAYS are moved to a compressed archive
+# table every HISTORY_COMPACT_INTERVAL seconds (0 disables the job); their
+# profile and summary stay. HISTORY_VACUUM is "incremental", "full" (VACUUM
+# blocks writers while it runs) or "off".
+HISTORY_IDLE_DAYS = float(os.getenv("HISTORY_IDLE_DAYS", "30"))
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "3600"))
+HISTORY_COMPACT_BATCH = int(os.getenv("HISTORY_COMPACT_BATCH", "200"))
+HISTORY_COMPRESS_LEVEL = int(os.getenv("HISTORY_COMPRESS_LEVEL", "6"))
+HISTORY_VACUUM = os.getenv("HISTORY_VACUUM", "incremental").lower()
+# Pages released per incremental vacuum (0 = all free pages).
+HISTORY_VACUUM_MAX_PAGES = int(os.getenv("HISTORY_VACUUM_MAX_PAGES", "0"))
+
+
+# ---------------------------
+# Prompt Context Budget
+# ---------------------------
+
+# Upper bound on prompt input tokens. Instructions and the user's message
+# always go in; evidence, summary and history fill the rest, in that order.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "250"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "3"))
+# Extra chunks are retrieved so duplicates can be dropped without losing evidence.
+CONTEXT_RETRIEVE_K = int(os.getenv("CONTEXT_RETRIEVE_K", "6"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+
+# ---------------------------
+# Intent Fast-Path
+# ---------------------------
+
+# Greetings, thanks and other non-clinical messages get a templated reply
+# from a local embedding classifier instead of a call to the main model.
+INTENT_FAST_PATH_ENABLED = os.getenv("INTENT_FAST_PATH_ENABLED", "1").lower() in ("1", "true", "yes")
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.75"))
+INTENT_MARGIN = float(os.getenv("INTENT_MARGIN", "0.1"))
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", "6"))
+
+
+# ---------------------------
+# Logging
+# ---------------------------
+
+# LOG_FORMAT "json" writes one JSON object per line; "text" is for terminals.
+# DEBUG adds per-request prompt sizes and per-step timings.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
@@ -0,0 +1,205 @@
+import re
+
+from app.telemetry import PROMPT_OVER_BUDGET, PROMPT_SECTION_TOKENS, PROMPT_TOKENS, PROMPT_TRIMMED
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to an estimate
+    tiktoken = None
+
+
+# ---------------------------
+# Token Counting
+# ---------------------------
+
+# Llama 3 uses a tiktoken BPE; cl100k_base is close enough for budgeting.
+_ENCODING = tiktoken.get_encoding("cl100k_base") if tiktoken else None
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Per-message framing (role markers etc.) added by the chat template.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+
+    # Without tiktoken: words split into ~1.3 tokens on average, and each
+    # punctuation mark is a token of its own.
+    pieces = _PIECES.findall(text)
+    words = sum(1 for piece in pieces if piece[0].isalnum() or piece[0] == "_")
+    return int(words * 1.3) + (len(pieces) - words)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max_tokens])
+
+    words = text.split()
+    keep = int(max_tokens / 1.3)
+    while keep > 0 and count_tokens(" ".join(words[:keep])) > max_tokens:
+        keep -= 1
+    return " ".join(words[:keep])
+
+
+# ---------------------------
+# Chunk De-duplication
+# ---------------------------
+
+def _shingles(text: str, size: int = 5):
+    words = text.lower().split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _overlap_length(left: str, right: str, min_chars: int) -> int:
+    """
+    Length of the longest suffix of `left` that is also a prefix of `right`.
+    """
+    for length in range(min(len(left), len(right)), min_chars - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def deduplicate_chunks(chunks, threshold: float = 0.8, min_overlap_chars: int = 20):
+    """
+    Drop chunks whose word 5-grams are mostly (>= threshold) contained in
+    chunks already kept, and trim the text that adjacent splitter chunks
+    share at their edges. Order is preserved. Returns (kept, dropped count).
+    """
+    kept = []
+    seen = set()
+    dropped = 0
+
+    for chunk in chunks:
+        text = chunk.strip()
+        shingles = _shingles(text)
+        if not shingles or len(shingles & seen) / len(shingles) >= threshold:
+            dropped += 1
+            continue
+
+        for previous in kept:
+            text = text[_overlap_length(previous, text, min_overlap_chars):]
+            cut = _overlap_length(text, previous, min_overlap_chars)
+            if cut:
+                text = text[:-cut]
+        text = text.strip()
+
+        # Nothing substantial left once the shared edges are cut.
+        if len(text) < min_overlap_chars:
+            dropped += 1
+            continue
+
+        kept.append(text)
+        seen |= shingles
+
+    return kept, dropped
+
+
+# ---------------------------
+# Context Packer
+# ---------------------------
+
+class ContextPacker:
+    """
+    Fits the variable parts of the prompt into a token budget.
+
+    The instructions and the user's message are always sent. What is left of
+    `budget` is filled in priority order:
+      1. retrieved evidence, de-duplicated, best-ranked first (up to max_chunks)
+      2. the rolling summary, truncated to summary_max_tokens
+      3. recent history, newest message first
+    Anything that does not fit is dropped whole (the summary is truncated).
+    """
+
+    def __init__(
+        self,
+        budget: int = 4000,
+        summary_max_tokens: int = 250,
+        max_chunks: int = 3,
+        dedup_threshold: float = 0.8,
+    ):
+        self.budget = budget
+        self.summary_max_tokens = summary_max_tokens
+        self.max_chunks = max_chunks
+        self.dedup_threshold = dedup_threshold
+
+    def pack(self, instructions: str, user_message: str, summary: str, chunks, history, format_chunk) -> dict:
+        """
+        `instructions` is the system prompt with empty summary and evidence;
+        `format_chunk(i, text)` renders evidence as it appears in the prompt;
+        `history` items need `.role` and `.message`.
+        """
+        tokens = {
+            "instructions": count_tokens(instructions) + MESSAGE_OVERHEAD_TOKENS,
+            "user": count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS,
+            "evidence": 0,
+            "summary": 0,
+            "history": 0,
+        }
+        remaining = self.budget - tokens["instructions"] - tokens["user"]
+
+        unique_chunks, deduplicated = deduplicate_chunks(chunks, self.dedup_threshold)
+        # Chunks past max_chunks are extra recall, not trimmed evidence.
+        candidates = unique_chunks[:self.max_chunks]
+        evidence = []
+        for text in candidates:
+            cost = count_tokens(format_chunk(len(evidence), text))
+            if cost > remaining:
+                break
+            evidence.append(text)
+            tokens["evidence"] += cost
+            remaining -= cost
+
+        packed_summary = ""
+        if summary and remaining > 0:
+            packed_summary = truncate_to_tokens(summary, min(self.summary_max_tokens, remaining))
+            tokens["summary"] = count_tokens(packed_summary)
+            remaining -= tokens["summary"]
+
+        packed_history = []
+        for message in reversed(list(history)):
+            cost = count_tokens(message.message) + MESSAGE_OVERHEAD_TOKENS
+            if cost > remaining:
+                break
+            packed_history.append(message)
+            tokens["history"] += cost
+            remaining -= cost
+        packed_history.reverse()
+
+        # An assistant reply without the user turn before it reads oddly.
+        if packed_history and packed_history[0].role == "assistant":
+            tokens["history"] -= count_tokens(packed_history[0].message) + MESSAGE_OVERHEAD_TOKENS
+            packed_history = packed_history[1:]
+
+        packed = {
+            "summary": packed_summary,
+            "evidence": evidence,
+            "history": packed_history,
+            "tokens": tokens,
+            "total_tokens": sum(tokens.values()),
+            "budget": self.budget,
+            "chunks_deduplicated": deduplicated,
+            "chunks_dropped": len(candidates) - len(evidence),
+            "history_dropped": len(history) - len(packed_history),
+        }
+        record_prompt(packed)
+
+        return packed
+
+
+def record_prompt(packed: dict):
+    PROMPT_TOKENS.observe(packed["total_tokens"])
+    if packed["total_tokens"] > packed["budget"]:
+        PROMPT_OVER_BUDGET.inc()
+    for section, tokens in packed["tokens"].items():
+        PROMPT_SECTION_TOKENS.inc(section, amount=tokens)
+    for trimmed in ("chunks_deduplicated", "chunks_dropped", "history_dropped"):
+        if packed[trimmed]:
+            PROMPT_TRIMMED.inc(trimmed, amount=packed[trimmed])
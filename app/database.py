@@ -1,14 +1,50 @@
+import json
+import os
 import sqlite3
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+import zlib
+from sqlalchemy import create_engine, delete, event, func, select, Column, Integer, LargeBinary, String, Text, DateTime, Index
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 
 
-DATABASE_URL = "sqlite:///./chat_history.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chat_history.db")
+
+# SQLite tuning: WAL lets readers run alongside the writer, NORMAL sync is
+# durable across application crashes (only an OS crash can lose the last
+# commits), and a larger page cache keeps hot history pages in memory.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# INCREMENTAL lets the compaction job hand freed pages back to the OS a few
+# at a time; NONE leaves the file at its high-water mark until a VACUUM.
+SQLITE_AUTO_VACUUM = os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL").upper()
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine)
 
+
+@event.listens_for(engine, "connect")
+def configure_sqlite(dbapi_connection, connection_record):
+    # Let SQLAlchemy issue BEGIN itself (see begin_transaction) so reads in
+    # one session share a single snapshot instead of pysqlite's autocommit.
+    dbapi_connection.isolation_level = None
+
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new database, and only before it switches to
+    # WAL; existing files need a VACUUM (see set_auto_vacuum).
+    cursor.execute(f"PRAGMA auto_vacuum={SQLITE_AUTO_VACUUM}")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+@event.listens_for(engine, "begin")
+def begin_transaction(connection):
+    connection.exec_driver_sql("BEGIN")
+
 Base = declarative_base()
 
 
@@ -21,6 +57,11 @@ class Conversation(Base):
     message = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Serves "last N messages of a session" and per-session counts.
+        Index("ix_conversations_session_timestamp", "session_id", "timestamp"),
+    )
+
 class UserProfile(Base):
     __tablename__ = "user_profiles"
     session_id = Column(String, primary_key=True, unique=True, index=True)
@@ -34,42 +75,312 @@ class ConversationSummary(Base):
     summary = Column(Text)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
+class ConversationArchive(Base):
+    """
+    Messages of idle sessions, moved out of `conversations` by
+    compact_history: one zlib-compressed JSON line per message.
+    """
+    __tablename__ = "conversation_archives"
+
+    session_id = Column(String, primary_key=True)
+    messages = Column(LargeBinary)
+    message_count = Column(Integer)
+    first_message_at = Column(DateTime)
+    last_message_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Fixed text every response carries; it is not worth a copy per stored turn.
+STORED_DISCLAIMER = "Educational only. Not medical advice."
+
+
+def encode_assistant_message(parsed: dict) -> str:
+    """
+    Compact JSON for a stored assistant turn: no padding, no escaped
+    non-ASCII, and without empty fields or the standard disclaimer. Readers
+    use .get() with defaults, so the dropped keys read back as empty.
+    """
+    compact = {
+        key: value
+        for key, value in parsed.items()
+        if value not in (None, "", [], {}) and not (key == "disclaimer" and value == STORED_DISCLAIMER)
+    }
+    return json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
-def save_user_city(session_id: str, city: str):
+    # create_all skips indexes on tables that already exist.
+    for index in Conversation.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+def write_batch(conversation_rows, cities: dict):
+    """
+    Insert conversation rows and apply profile city updates in a single
+    transaction. Cities that are already stored are left untouched.
+    """
     db = SessionLocal()
+    try:
+        db.add_all(Conversation(**row) for row in conversation_rows)
 
-    profile = db.query(UserProfile).filter_by(session_id=session_id).first()
+        if cities:
+            profiles = {
+                profile.session_id: profile
+                for profile in db.query(UserProfile).filter(UserProfile.session_id.in_(list(cities)))
+            }
+            for session_id, city in cities.items():
+                profile = profiles.get(session_id)
+                if profile is None:
+                    db.add(UserProfile(session_id=session_id, city=city))
+                elif profile.city != city:
+                    profile.city = city
 
-    if profile:
-        profile.city = city
-    else:
-        profile = UserProfile(session_id=session_id, city=city)
-        db.add(profile)
+        db.commit()
+    finally:
+        db.close()
 
-    db.commit()
-    db.close()
 
-
-def get_user_city(session_id: str):
+def load_session_context(session_id: str, trigger: int, keep_recent: int) -> dict:
+    """
+    Read everything a turn needs in one transaction: profile city, stored
+    summary, message count and only the recent messages that will be sent
+    (all of them up to `trigger`, else the last `keep_recent`).
+    """
     db = SessionLocal()
-    profile = db.query(UserProfile).filter_by(session_id=session_id).first()
-    db.close()
+    try:
+        profile = db.query(UserProfile).filter_by(session_id=session_id).first()
+        summary_entry = db.query(ConversationSummary).filter_by(session_id=session_id).first()
+
+        message_count = (
+            db.query(func.count(Conversation.id))
+            .filter(Conversation.session_id == session_id)
+            .scalar()
+        )
+
+        window = keep_recent if message_count > trigger else trigger
+        recent_messages = (
+            db.query(Conversation)
+            .filter(Conversation.session_id == session_id)
+            .order_by(Conversation.timestamp.desc())
+            .limit(window)
+            .all()
+        )
+        recent_messages.reverse()
+    finally:
+        db.close()
+
+    return {
+        "city": profile.city if profile else None,
+        "summary": summary_entry.summary if summary_entry else "",
+        "message_count": message_count,
+        "recent_messages": recent_messages,
+    }
 
-    return profile.city if profile else None
 
-def save_summary(session_id: str, summary_text: str):
+def save_summary(session_id: str, summary_text: str, updated_at: datetime = None):
+    """
+    `updated_at` is the timestamp of the newest message folded into the
+    summary; later messages are folded in on the next refresh.
+    """
     db = SessionLocal()
     summary_entry = db.query(ConversationSummary).filter_by(session_id=session_id).first()
+    updated_at = updated_at or datetime.utcnow()
 
     if summary_entry:
         summary_entry.summary = summary_text
-        summary_entry.updated_at = datetime.utcnow()
+        summary_entry.updated_at = updated_at
     else:
-        summary_entry = ConversationSummary(session_id=session_id, summary=summary_text)
+        summary_entry = ConversationSummary(
+            session_id=session_id,
+            summary=summary_text,
+            updated_at=updated_at
+        )
         db.add(summary_entry)
 
     db.commit()
-    db.close()
\ No newline at end of file
+    db.close()
+
+
+def get_summary_backlog(session_id: str, trigger: int, keep_recent: int):
+    """
+    Return (current summary, messages not yet folded into it).
+
+    Only messages newer than the summary watermark and older than the
+    `keep_recent` most recent ones are returned, and nothing is returned
+    until the session has more than `trigger` messages.
+    """
+    db = SessionLocal()
+    try:
+        total = db.query(Conversation).filter_by(session_id=session_id).count()
+        if total <= trigger:
+            return "", []
+
+        summary_entry = db.query(ConversationSummary).filter_by(session_id=session_id).first()
+
+        query = db.query(Conversation).filter(Conversation.session_id == session_id)
+        if summary_entry and summary_entry.updated_at:
+            query = query.filter(Conversation.timestamp > summary_entry.updated_at)
+
+        unsummarized = query.order_by(Conversation.timestamp).all()
+    finally:
+        db.close()
+
+    previous_summary = summary_entry.summary if summary_entry else ""
+    return previous_summary, unsummarized[:-keep_recent] if keep_recent else unsummarized
+
+
+# ---------------------------
+# Retention & Compaction
+# ---------------------------
+
+def find_idle_sessions(idle_before: datetime, limit: int) -> list:
+    """
+    Sessions whose newest live message is older than `idle_before`.
+    """
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Conversation.session_id)
+            .group_by(Conversation.session_id)
+            .having(func.max(Conversation.timestamp) < idle_before)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+    return [session_id for (session_id,) in rows]
+
+
+def _archive_lines(rows) -> bytes:
+    return b"".join(
+        json.dumps(
+            {"role": row.role, "message": row.message, "timestamp": row.timestamp.isoformat()},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode() + b"\n"
+        for row in rows
+    )
+
+
+def archive_session(session_id: str, idle_before: datetime, compress_level: int = 6) -> int:
+    """
+    Move a session's messages into its ConversationArchive row (appending
+    to any earlier archive) and return how many were moved. Nothing is
+    moved if the session has a message at or after `idle_before`, so a
+    user who came back since find_idle_sessions keeps their history. The
+    profile and rolling summary stay, so a returning user keeps their context.
+    """
+    newer = (
+        select(Conversation.id)
+        .where(Conversation.session_id == session_id, Conversation.timestamp >= idle_before)
+        .exists()
+    )
+
+    db = SessionLocal()
+    try:
+        # One statement checks the session is still idle and removes its
+        # rows, so no write can land between the check and the delete. As
+        # the transaction's first statement it also takes the write lock,
+        # which holds until the archive row below is committed.
+        rows = db.execute(
+            delete(Conversation)
+            .where(Conversation.session_id == session_id, ~newer)
+            .returning(Conversation.id, Conversation.role, Conversation.message, Conversation.timestamp)
+        ).all()
+        if not rows:
+            db.rollback()
+            return 0
+
+        rows.sort(key=lambda row: (row.timestamp, row.id))
+        lines = _archive_lines(rows)
+
+        archive = db.get(ConversationArchive, session_id)
+        if archive is None:
+            archive = ConversationArchive(
+                session_id=session_id,
+                messages=zlib.compress(lines, compress_level),
+                message_count=len(rows),
+                first_message_at=rows[0].timestamp,
+                last_message_at=rows[-1].timestamp,
+            )
+            db.add(archive)
+        else:
+            archive.messages = zlib.compress(zlib.decompress(archive.messages) + lines, compress_level)
+            archive.message_count += len(rows)
+            archive.last_message_at = rows[-1].timestamp
+            archive.archived_at = datetime.utcnow()
+
+        db.commit()
+        return len(rows)
+    finally:
+        db.close()
+
+
+def load_archived_messages(session_id: str) -> list:
+    """
+    A session's archived messages as dicts (role, message, timestamp), oldest first.
+    """
+    db = SessionLocal()
+    try:
+        archive = db.get(ConversationArchive, session_id)
+    finally:
+        db.close()
+
+    if archive is None:
+        return []
+    return [json.loads(line) for line in zlib.decompress(archive.messages).splitlines()]
+
+
+def _pragma(cursor, name: str) -> int:
+    return cursor.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def reclaim_space(mode: str = "incremental", max_pages: int = 0) -> dict:
+    """
+    Return free pages to the OS and truncate the WAL.
+
+    "incremental" releases up to `max_pages` free pages (0 = all) when the
+    database uses auto_vacuum=INCREMENTAL; "full" rewrites the file with
+    VACUUM, which also defragments it but locks out writers while it runs.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        before = _pragma(cursor, "page_count")
+        free = _pragma(cursor, "freelist_count")
+
+        if mode == "full":
+            cursor.execute("VACUUM")
+        elif mode == "incremental" and free:
+            # executescript steps the pragma to completion; execute() would
+            # free a single page.
+            cursor.executescript(f"PRAGMA incremental_vacuum({max_pages or free});")
+
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.fetchall()
+        after = _pragma(cursor, "page_count")
+        page_size = _pragma(cursor, "page_size")
+        cursor.close()
+    finally:
+        connection.close()
+
+    return {"freed_pages": before - after, "freed_bytes": (before - after) * page_size, "free_pages_before": free}
+
+
+def set_auto_vacuum(mode: str = SQLITE_AUTO_VACUUM) -> bool:
+    """
+    Switch an existing database to `mode` (a one-off VACUUM); True if it changed.
+    """
+    modes = {"NONE": 0, "FULL": 1, "INCREMENTAL": 2}
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if _pragma(cursor, "auto_vacuum") == modes[mode]:
+            return False
+        cursor.execute(f"PRAGMA auto_vacuum={mode}")
+        cursor.execute("VACUUM")
+        cursor.close()
+        return True
+    finally:
+        connection.close()
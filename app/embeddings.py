@@ -0,0 +1,98 @@
+from sentence_transformers import SentenceTransformer
+import logging
+import os
+import time
+import warnings
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Embedding Backends
+# ---------------------------
+
+# "fp32": the model as published, on sentence-transformers' default device
+#         (a GPU when one is available).
+# "int8": Linear layers dynamically quantized to int8. Faster and smaller,
+#         at a small cost in embedding fidelity; measure with
+#         benchmark_embeddings.py before switching. The model always runs on
+#         the CPU: dynamic quantization has no GPU kernels. It uses
+#         torch.ao.quantization, which recent torch releases deprecate in
+#         favour of torchao; its deprecation warnings are silenced here.
+EMBEDDING_BACKENDS = ("fp32", "int8")
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fp32").lower()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = torch default
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "1").lower() not in ("0", "false", "no")
+
+WARMUP_QUERIES = [
+    "I have a headache and fever",
+    "chest pain and shortness of breath since this morning",
+    "hi",
+]
+
+
+def set_embedding_threads(threads: int):
+    """
+    Set torch intra-op threads for this process (0 leaves the default).
+    """
+    if threads <= 0:
+        return
+
+    import torch
+    torch.set_num_threads(threads)
+
+
+def load_embedding_model(
+    model_name: str,
+    backend: str = EMBEDDING_BACKEND,
+    threads: int = EMBEDDING_THREADS,
+    warmup: bool = EMBEDDING_WARMUP,
+) -> SentenceTransformer:
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+
+    set_embedding_threads(threads)
+
+    if backend == "int8":
+        model = SentenceTransformer(model_name, device="cpu")
+        quantize_int8(model)
+    else:
+        model = SentenceTransformer(model_name)
+
+    logger.info("Embedding model loaded", extra={"model": model_name, "backend": backend, "device": str(model.device)})
+
+    if warmup:
+        warm_up(model)
+
+    return model
+
+
+def quantize_int8(model: SentenceTransformer):
+    import torch
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="torch.ao.quantization", category=DeprecationWarning)
+        warnings.filterwarnings("ignore", message="torch.quantize_per_tensor", category=UserWarning)
+        try:
+            from torch.ao.quantization import quantize_dynamic
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=int8 needs torch.ao.quantization, which this torch no longer ships; use fp32"
+            ) from e
+
+        quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def warm_up(model: SentenceTransformer):
+    """
+    Run a few encodes so the first real request doesn't pay for lazy
+    initialisation (kernel selection, allocator growth).
+    """
+    start = time.perf_counter()
+    for query in WARMUP_QUERIES:
+        model.encode([query], normalize_embeddings=True)
+    model.encode(WARMUP_QUERIES, normalize_embeddings=True)
+
+    logger.info("Embedding model warmed up in %.0f ms", (time.perf_counter() - start) * 1000)
@@ -0,0 +1,158 @@
+import json
+import threading
+from collections import Counter
+
+import numpy as np
+
+
+# ---------------------------
+# Local Intent Fast-Path
+# ---------------------------
+
+# Labelled examples; a message takes the label of its most similar example.
+# Everything but "clinical" has a templated reply and skips the main model.
+INTENT_EXAMPLES = {
+    "greeting": [
+        "hi", "hello", "hey", "hey there", "hello doctor", "good morning",
+        "good evening", "namaste", "hi, how are you?",
+    ],
+    "thanks": [
+        "thanks", "thank you", "thank you so much", "thanks for the help",
+        "ok thanks", "that was helpful", "great, thanks",
+    ],
+    "wellbeing": [
+        "I'm fine", "i am fine", "I feel good", "I'm doing well", "all good",
+        "nothing wrong with me", "I am okay now", "I'm feeling better",
+    ],
+    "farewell": [
+        "bye", "goodbye", "see you", "talk to you later", "that's all",
+    ],
+    "unclear": [
+        "wow", "ok", "hmm", "lol", "test", "asdf", "what", "cool",
+    ],
+    "clinical": [
+        "I have a headache", "fever since yesterday", "my chest hurts",
+        "I feel dizzy", "stomach pain", "I have a cough", "I can't breathe",
+        "my child has a rash", "I feel sick", "I am not feeling well",
+        "pain in my leg", "vomiting", "I feel weak and tired",
+        "what is the dose of paracetamol", "is this serious",
+        "which hospital should I go to",
+    ],
+}
+
+FAST_PATH_REPLIES = {
+    "greeting": "Hello! I'm here to help with any health questions or symptoms you'd like to discuss.",
+    "thanks": "You're welcome! Let me know if anything else comes up or your symptoms change.",
+    "wellbeing": "Glad to hear you're feeling well. If you notice any symptoms, feel free to describe them.",
+    "farewell": "Take care! Come back anytime if you have health questions.",
+    "unclear": "I'm not sure I understood. Could you describe any symptoms or health concerns you have?",
+}
+
+
+def fast_path_response(label: str) -> dict:
+    """
+    The low-severity, no-condition answer the main model is instructed to
+    give for non-clinical messages.
+    """
+    return {
+        "severity_level": "low",
+        "reply": FAST_PATH_REPLIES[label],
+        "possible_conditions": [],
+        "precautions": [],
+        "next_steps": [],
+        "recommended_specialists": [],
+        "red_flags": [],
+        "follow_up_questions": [],
+        "disclaimer": "Educational only. Not medical advice.",
+    }
+
+
+def awaiting_answer(recent_messages) -> bool:
+    """
+    True when the last assistant turn asked follow-up questions or was not
+    low severity: then a short reply ("3 days", "no") is clinical context.
+    """
+    for message in reversed(list(recent_messages)):
+        if message.role != "assistant":
+            continue
+        try:
+            data = json.loads(message.message)
+        except (json.JSONDecodeError, TypeError):
+            return False
+        return bool(data.get("follow_up_questions")) or data.get("severity_level", "low") != "low"
+    return False
+
+
+class IntentClassifier:
+    """
+    Nearest-example classifier over the MedicalRAG embedding model.
+
+    A message takes the fast path when it is short (at most `max_words`
+    words), its best match is a non-clinical example with cosine similarity
+    >= `threshold`, and that match beats the best clinical example by at
+    least `margin`. Example embeddings are computed on first use; message
+    embeddings go through the RAG query cache and are reused by retrieval.
+    """
+
+    def __init__(self, rag, threshold: float = 0.75, margin: float = 0.1, max_words: int = 6):
+        self.rag = rag
+        self.threshold = threshold
+        self.margin = margin
+        self.max_words = max_words
+
+        self.checked = 0
+        self.fired = Counter()
+        self._matrix = None
+        self._labels = None
+        self._lock = threading.Lock()
+
+    def _prototypes(self):
+        with self._lock:
+            if self._matrix is None:
+                labels, texts = [], []
+                for label, examples in INTENT_EXAMPLES.items():
+                    labels += [label] * len(examples)
+                    texts += examples
+                self._matrix = self.rag.embed_queries(texts)
+                self._labels = np.asarray(labels)
+        return self._matrix, self._labels
+
+    def classify(self, message: str):
+        """
+        Return (label, similarity, best clinical similarity).
+        """
+        matrix, labels = self._prototypes()
+        scores = matrix @ self.rag.embed_query(message)
+
+        best = int(np.argmax(scores))
+        clinical = float(scores[labels == "clinical"].max())
+        return str(labels[best]), float(scores[best]), clinical
+
+    def fast_path(self, message: str, recent_messages) -> dict:
+        """
+        Return a templated response, or None if the main model should answer.
+        """
+        with self._lock:
+            self.checked += 1
+
+        if len(message.split()) > self.max_words or awaiting_answer(recent_messages):
+            return None
+
+        label, score, clinical = self.classify(message)
+        if label == "clinical" or score < self.threshold or score - clinical < self.margin:
+            return None
+
+        with self._lock:
+            self.fired[label] += 1
+
+        return fast_path_response(label)
+
+    def stats(self) -> dict:
+        with self._lock:
+            fired = sum(self.fired.values())
+            return {
+                "checked": self.checked,
+                "fired": fired,
+                "fired_by_intent": dict(self.fired),
+                "fire_rate": fired / self.checked if self.checked else 0.0,
+            }
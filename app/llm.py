@@ -1,22 +1,119 @@
-from groq import Groq
-from app.config import GROQ_API_KEY
+from groq import AsyncGroq
+from app.config import (
+    GROQ_API_KEY,
+    LLM_MAX_CONCURRENCY,
+    LLM_TIMEOUT,
+    LLM_ATTEMPT_TIMEOUT,
+    LLM_MODEL,
+    LLM_RPM,
+    LLM_TPM,
+    LLM_FALLBACK_MODEL,
+    LLM_FALLBACK_RPM,
+    LLM_FALLBACK_TPM,
+    LLM_FALLBACK_AFTER,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    SUMMARY_TRIGGER_MESSAGES,
+    SUMMARY_KEEP_RECENT,
+    SUMMARY_MIN_NEW_MESSAGES,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIZE,
+    PROMPT_TOKEN_BUDGET,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_MAX_CHUNKS,
+    CONTEXT_RETRIEVE_K,
+    CONTEXT_DEDUP_THRESHOLD,
+)
+from app.context_packer import ContextPacker
+from app.llm_scheduler import LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_NORMAL, guess_priority
 from app.database import (
-    SessionLocal,
-    Conversation,
-    ConversationSummary,
     save_summary,
+    get_summary_backlog,
+    load_session_context,
 )
+from app.persistence import write_queue
 from app.rag import MedicalRAG
+from app.response_cache import SemanticResponseCache
+from app.telemetry import STAGE_DURATION, span
+import asyncio
 import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Retries are the scheduler's job on the async path.
+async_client = AsyncGroq(api_key=GROQ_API_KEY, timeout=LLM_ATTEMPT_TIMEOUT, max_retries=0)
+
+
+def _create_completion(**kwargs):
+    # Looked up per call so the client can be swapped (benchmarks, tests).
+    return async_client.chat.completions.create(**kwargs)
+
+
+# Orders, rate-limits and retries Groq calls per worker on the async path.
+llm_scheduler = LLMScheduler(
+    _create_completion,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    limits={
+        LLM_MODEL: (LLM_RPM, LLM_TPM),
+        LLM_FALLBACK_MODEL: (LLM_FALLBACK_RPM, LLM_FALLBACK_TPM),
+    },
+    fallback_model=LLM_FALLBACK_MODEL,
+    fallback_after=LLM_FALLBACK_AFTER,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_max=LLM_BACKOFF_MAX,
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+)
 
-client = Groq(api_key=GROQ_API_KEY)
+response_cache = (
+    SemanticResponseCache(
+        max_entries=RESPONSE_CACHE_SIZE,
+        ttl_seconds=RESPONSE_CACHE_TTL,
+        threshold=RESPONSE_CACHE_THRESHOLD,
+    )
+    if RESPONSE_CACHE_ENABLED else None
+)
+
+context_packer = ContextPacker(
+    budget=PROMPT_TOKEN_BUDGET,
+    summary_max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+    max_chunks=CONTEXT_MAX_CHUNKS,
+    dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+)
+
+
+async def acreate_completion(priority: int = PRIORITY_NORMAL, **kwargs):
+    """
+    Async chat completion through the scheduler. LLM_TIMEOUT covers
+    queueing, retries and the requests themselves; each request gets the
+    shorter LLM_ATTEMPT_TIMEOUT.
+    """
+
+    return await asyncio.wait_for(llm_scheduler.complete(priority, **kwargs), LLM_TIMEOUT)
 
 
 # ---------------------------
 # Conversation Summarization
 # ---------------------------
 
-def summarize_conversation(messages):
+SUMMARY_PROMPT = """
+Maintain a rolling summary of the patient's medical history.
+Update the existing summary with the new patient messages, focusing only on:
+- Symptoms
+- Duration
+- Severity
+- Previous medical advice
+
+Keep under 250 words.
+"""
+
+
+def build_summary_request(messages, previous_summary: str = "") -> dict:
     """
     Summarize only user messages to avoid token explosion.
     """
@@ -29,107 +126,77 @@ def summarize_conversation(messages):
 
     combined_text = "\n".join(cleaned_messages)
 
-    try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """
-Summarize patient medical history focusing only on:
-- Symptoms
-- Duration
-- Severity
-- Previous medical advice
+    return {
+        "model": "llama-3.1-8b-instant",
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f"EXISTING SUMMARY:\n{previous_summary or '(none)'}\n\n"
+                    f"NEW PATIENT MESSAGES:\n{combined_text}"
+                )
+            }
+        ],
+        "temperature": 0.2,
+        "max_tokens": 250,
+    }
+
+
+async def asummarize_conversation(messages, previous_summary: str = ""):
 
-Keep under 250 words.
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": combined_text
-                }
-            ],
-            temperature=0.2,
-            max_tokens=250,
-        )
+    try:
+        with span("summarization"):
+            response = await acreate_completion(
+                PRIORITY_BACKGROUND, **build_summary_request(messages, previous_summary)
+            )
 
         return response.choices[0].message.content
 
     except Exception as e:
-        print("Summarization failed:", e)
+        logger.warning("Summarization failed", extra={"error": str(e)})
         return ""
 
 
-def get_summary(session_id: str) -> str:
-    db = SessionLocal()
-    summary_entry = (
-        db.query(ConversationSummary)
-        .filter_by(session_id=session_id)
-        .first()
+async def arefresh_summary(session_id: str):
+
+    previous_summary, messages = await asyncio.to_thread(
+        get_summary_backlog, session_id, SUMMARY_TRIGGER_MESSAGES, SUMMARY_KEEP_RECENT
     )
-    db.close()
+    if len(messages) < SUMMARY_MIN_NEW_MESSAGES:
+        return
 
-    return summary_entry.summary[:1000] if summary_entry else ""
+    summary_text = await asummarize_conversation(messages, previous_summary)
+    if summary_text:
+        await asyncio.to_thread(
+            save_summary, session_id, summary_text, messages[-1].timestamp
+        )
 
 
 # ---------------------------
-# Main Medical Response
+# Shared Helpers
 # ---------------------------
 
-def get_medical_response(
-    user_message: str,
-    session_id: str,
-    rag: MedicalRAG,
-    model: str = "llama-3.3-70b-versatile"
-) -> dict:
+def load_context(session_id: str) -> dict:
+    with span("db_load"):
+        return load_session_context(session_id, SUMMARY_TRIGGER_MESSAGES, SUMMARY_KEEP_RECENT)
 
-    db = SessionLocal()
 
-    previous_messages = (
-        db.query(Conversation)
-        .filter(Conversation.session_id == session_id)
-        .order_by(Conversation.timestamp)
-        .all()
-    )
-
-    # ---------------------------
-    # Smart Conversation Memory
-    # ---------------------------
-
-    if len(previous_messages) > 12:
-        summary_text = summarize_conversation(previous_messages[:-6])
-        if summary_text:
-            save_summary(session_id, summary_text)
-
-        recent_messages = previous_messages[-6:]
-    else:
-        recent_messages = previous_messages
-
-    chat_history = [
-        {"role": msg.role, "content": msg.message}
-        for msg in recent_messages
-    ]
+def format_evidence(i: int, doc: str) -> str:
+    return f"\n[Medical Evidence {i+1}]\n{doc}\n"
 
-    summary = get_summary(session_id)
-
-    # ---------------------------
-    # RAG Retrieval
-    # ---------------------------
-
-    retrieved_docs = rag.retrieve(user_message, top_k=3)
 
+def format_context(retrieved_docs) -> str:
     formatted_context = ""
     for i, doc in enumerate(retrieved_docs):
-        formatted_context += f"\n[Medical Evidence {i+1}]\n{doc}\n"
+        formatted_context += format_evidence(i, doc)
 
-    print("Retrieved Context:\n", formatted_context)
+    return formatted_context
 
-    # ---------------------------
-    # System Prompt
-    # ---------------------------
 
-    system_prompt = f"""
+def build_system_prompt(summary: str, formatted_context: str) -> str:
+
+    return f"""
 You are an advanced medical knowledge assistant.
 
 PATIENT HISTORY SUMMARY:
@@ -202,59 +269,259 @@ Rules:
 - Ensure JSON is syntactically valid.
 """
 
+
+
+def build_prompt(user_message: str, recent_messages, summary: str, retrieved_docs) -> list:
+    """
+    Pack summary, evidence and history into the prompt token budget and
+    build the chat messages for the main model.
+    """
+
+    packed = context_packer.pack(
+        build_system_prompt("", ""),
+        user_message,
+        summary,
+        retrieved_docs,
+        recent_messages,
+        format_evidence,
+    )
+
+    tokens = packed["tokens"]
+    logger.debug(
+        "Prompt packed",
+        extra={
+            "prompt_tokens": packed["total_tokens"],
+            "budget": packed["budget"],
+            "evidence_tokens": tokens["evidence"],
+            "summary_tokens": tokens["summary"],
+            "history_tokens": tokens["history"],
+            "chunks": len(packed["evidence"]),
+            "chunks_deduplicated": packed["chunks_deduplicated"],
+            "history_messages": len(packed["history"]),
+        },
+    )
+
+    system_prompt = build_system_prompt(packed["summary"], format_context(packed["evidence"]))
+    return build_messages(system_prompt, packed["history"], user_message)
+
+
+def build_messages(system_prompt: str, recent_messages, user_message: str):
+
+    chat_history = [
+        {"role": msg.role, "content": msg.message}
+        for msg in recent_messages
+    ]
+
     messages = [{"role": "system", "content": system_prompt}]
     messages.extend(chat_history)
     messages.append({"role": "user", "content": user_message})
 
-    # ---------------------------
-    # Call Main Model
-    # ---------------------------
+    return messages
 
+
+def parse_model_output(content: str) -> dict:
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.2,
-            max_tokens=1200,  # Reduced slightly for safety
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return {
+            "error": "Model returned invalid JSON",
+            "raw_response": content
+        }
+
+
+# ---------------------------
+# Medical Response
+# ---------------------------
+
+async def aload_history(session_id: str, context: dict = None):
+    """
+    Return (recent messages, stored summary) for a session, reusing a
+    context already loaded by the endpoint when there is one.
+    """
+
+    if context is None:
+        context = await asyncio.to_thread(load_context, session_id)
+
+    # The rolling summary is refreshed by the background SummaryWorker
+    # after the response is sent, so only the stored one is read here.
+    return context["recent_messages"], context["summary"]
+
+
+def retrieve_evidence(rag: MedicalRAG, user_message: str):
+    with span("retrieval"):
+        return rag.retrieve(user_message, top_k=CONTEXT_RETRIEVE_K)
+
+
+def start_retrieval(rag: MedicalRAG, user_message: str):
+    """
+    Start retrieving evidence in the thread pool and return the future, so
+    retrieval overlaps history loading and the fast-path / cache checks.
+    """
+
+    future = asyncio.ensure_future(asyncio.to_thread(retrieve_evidence, rag, user_message))
+    # Mark failures as retrieved; whoever awaits the future still sees them.
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return future
+
+
+def discard_future(future):
+    if future is not None and not future.done():
+        future.cancel()
+
+
+async def abuild_messages(
+    user_message: str,
+    recent_messages,
+    summary: str,
+    rag: MedicalRAG,
+    retrieval=None
+) -> list:
+    """
+    Retrieve evidence without blocking the loop (or await retrieval already
+    started with start_retrieval), then build the chat messages for the
+    main model.
+    """
+
+    if retrieval is None:
+        retrieval = start_retrieval(rag, user_message)
+    retrieved_docs = await retrieval
+
+    return build_prompt(user_message, recent_messages, summary, retrieved_docs)
+
+
+async def alookup_cached_response(
+    user_message: str,
+    recent_messages,
+    summary: str,
+    rag: MedicalRAG
+):
+    """
+    Return (cached response or None, query vector to store under or None).
+    Only sessions without history or summary are eligible.
+    """
+
+    if response_cache is None or recent_messages or summary:
+        return None, None
+
+    vector = await asyncio.to_thread(rag.embed_query, user_message)
+    return response_cache.lookup(vector), vector
+
+
+def cache_response(cache_vector, parsed: dict):
+    if cache_vector is not None and response_cache is not None:
+        response_cache.store(cache_vector, parsed)
+
+
+async def atry_fast_path(intent_classifier, user_message: str, recent_messages):
+    """
+    Return a templated response for non-clinical messages, or None.
+    """
+
+    if intent_classifier is None:
+        return None
+
+    return await asyncio.to_thread(intent_classifier.fast_path, user_message, recent_messages)
+
+
+async def astream_completion(
+    messages: list,
+    model: str = LLM_MODEL,
+    max_tokens: int = 1200,
+    priority: int = PRIORITY_NORMAL
+):
+    """
+    Yield content deltas from a streamed completion.
+    Holds a scheduler slot for the duration of the stream.
+    """
+
+    with span("llm_stream"):
+        start = time.perf_counter()
+        stream = await asyncio.wait_for(
+            llm_scheduler.open_stream(
+                priority,
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                max_tokens=max_tokens,
+            ),
+            LLM_TIMEOUT
         )
 
-        content = response.choices[0].message.content
+        try:
+            first = True
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first:
+                        STAGE_DURATION.observe(time.perf_counter() - start, "llm_first_token")
+                        first = False
+                    yield delta
+        finally:
+            llm_scheduler.release()
+
+
+async def aget_medical_response(
+    user_message: str,
+    session_id: str,
+    rag: MedicalRAG,
+    model: str = LLM_MODEL,
+    context: dict = None,
+    retrieval=None
+) -> dict:
+    """
+    Answer a user message with the structured medical response (severity,
+    possible conditions, next steps, ...) and queue the turn for saving.
+    Runs on the FastAPI event loop: Groq calls go through AsyncGroq, while
+    SQLite access and embedding/FAISS work are offloaded to the default
+    thread pool.
+
+    `retrieval` is a future from start_retrieval; without one, retrieval is
+    started here so it runs while the history loads.
+    """
 
-    except Exception as e:
-        print("LLM Error:", e)
-        db.close()
-        return {"error": "Model request failed."}
+    if retrieval is None:
+        retrieval = start_retrieval(rag, user_message)
+
+    try:
+        recent_messages, summary = await aload_history(session_id, context)
+
+        cached, cache_vector = await alookup_cached_response(
+            user_message, recent_messages, summary, rag
+        )
+        if cached is not None:
+            write_queue.save_turn(session_id, user_message, cached)
+            return cached
 
-    # ---------------------------
-    # Parse JSON Safely
-    # ---------------------------
+        messages = await abuild_messages(user_message, recent_messages, summary, rag, retrieval)
+    finally:
+        discard_future(retrieval)
 
     try:
-        parsed = json.loads(content)
-    except json.JSONDecodeError:
-        parsed = {
-            "error": "Model returned invalid JSON",
-            "raw_response": content
-        }
+        with span("llm_call"):
+            response = await acreate_completion(
+                guess_priority(user_message, recent_messages),
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                max_tokens=1200,
+            )
 
-    # ---------------------------
-    # Store Conversation Safely
-    # ---------------------------
+        content = response.choices[0].message.content
+
+    except asyncio.TimeoutError:
+        logger.error("LLM request timed out", extra={"model": model})
+        return {"error": "Model request timed out."}
 
-    db.add(Conversation(
-        session_id=session_id,
-        role="user",
-        message=user_message
-    ))
+    except Exception as e:
+        logger.error("LLM request failed", extra={"error": str(e), "model": model})
+        return {"error": "Model request failed."}
 
-    db.add(Conversation(
-    session_id=session_id,
-    role="assistant",
-    message=json.dumps(parsed)
-        ))
+    parsed = parse_model_output(content)
 
+    cache_response(cache_vector, parsed)
 
-    db.commit()
-    db.close()
+    write_queue.save_turn(session_id, user_message, parsed)
 
     return parsed
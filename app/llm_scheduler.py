@@ -0,0 +1,455 @@
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import random
+import time
+
+import groq
+
+from app.context_packer import MESSAGE_OVERHEAD_TOKENS, count_tokens
+from app.matching import PhraseMatcher
+from app.telemetry import Counter, Gauge, Histogram, LLM_REQUESTS_IN_FLIGHT, request_id
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Request Priority
+# ---------------------------
+
+PRIORITY_EMERGENCY = 0
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 2
+PRIORITY_BACKGROUND = 3  # summaries and other work nobody is waiting on
+
+PRIORITY_NAMES = {
+    PRIORITY_EMERGENCY: "emergency",
+    PRIORITY_HIGH: "high",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background",
+}
+
+EMERGENCY_KEYWORDS = (
+    "chest pain", "can't breathe", "cannot breathe", "can not breathe",
+    "difficulty breathing", "shortness of breath", "not breathing",
+    "unconscious", "fainted", "passed out", "seizure", "convulsion",
+    "stroke", "face drooping", "slurred speech", "heart attack",
+    "severe bleeding", "bleeding heavily", "coughing blood", "vomiting blood",
+    "overdose", "poisoning", "suicide", "kill myself", "anaphylaxis",
+    "throat swelling", "severe burn", "seizures", "convulsions",
+)
+EMERGENCY_MATCHER = PhraseMatcher.from_phrases(EMERGENCY_KEYWORDS)
+
+
+def guess_priority(message: str, recent_messages=()) -> int:
+    """
+    Cheap severity guess before the model has seen the message: emergency
+    keywords win, then a previous assistant turn rated high or emergency.
+    """
+    if EMERGENCY_MATCHER.contains(message):
+        return PRIORITY_EMERGENCY
+
+    for previous in reversed(list(recent_messages)):
+        if previous.role != "assistant":
+            continue
+        try:
+            severity = json.loads(previous.message).get("severity_level")
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            severity = None
+        if severity in ("high", "emergency"):
+            return PRIORITY_HIGH
+        break
+
+    return PRIORITY_NORMAL
+
+
+# ---------------------------
+# Scheduler Metrics
+# ---------------------------
+
+LLM_QUEUE_WAIT = Histogram(
+    "medigrated_llm_queue_wait_seconds",
+    "Time LLM requests wait for a slot and rate-limit budget.",
+    ("priority",),
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "medigrated_llm_queue_depth",
+    "LLM requests waiting in the scheduler.",
+)
+LLM_RETRIES = Counter(
+    "medigrated_llm_retries_total",
+    "LLM requests retried, by error type.",
+    ("reason",),
+)
+LLM_FALLBACKS = Counter(
+    "medigrated_llm_fallbacks_total",
+    "LLM requests moved to the fallback model after waiting too long.",
+)
+
+
+# ---------------------------
+# Rate Limits
+# ---------------------------
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute, up to a minute's worth.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """
+        Seconds until `cost` units are available (0 if they are now).
+        """
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        cost = min(cost, self.capacity)  # an oversized request waits for a full bucket
+        wait = max(0.0, (cost - self.level) / self.rate)
+        return max(wait, self.paused_until - now)
+
+    def take(self, cost: float, now: float):
+        if self.capacity > 0:
+            self._refill(now)
+            self.level -= min(cost, self.capacity)
+
+    def give_back(self, amount: float):
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+    def pause(self, seconds: float, now: float):
+        # Provider said stop (429): spend the budget and wait it out.
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.level = min(self.level, 0.0)
+
+
+class ModelLimits:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one model.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def delay(self, cost: float, now: float) -> float:
+        return max(self.requests.delay(1, now), self.tokens.delay(cost, now))
+
+    def take(self, cost: float, now: float):
+        self.requests.take(1, now)
+        self.tokens.take(cost, now)
+
+    def pause(self, seconds: float, now: float):
+        self.requests.pause(seconds, now)
+        self.tokens.pause(seconds, now)
+
+
+# ---------------------------
+# Retries
+# ---------------------------
+
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.APIConnectionError,  # includes APITimeoutError
+    groq.InternalServerError,
+    asyncio.TimeoutError,  # attempt_timeout
+)
+
+
+def retry_after(error) -> float:
+    """
+    Seconds the provider asked us to wait, from a 429's headers, or 0.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def estimate_tokens(messages, max_tokens: int) -> int:
+    # Providers count the completion allowance against the token limit too.
+    prompt = sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+    return prompt + max_tokens
+
+
+# ---------------------------
+# Scheduler
+# ---------------------------
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "model", "cost", "enqueued", "attempt_enqueued", "future", "request_id")
+
+    def __init__(self, priority, seq, model, cost, enqueued, future):
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.cost = cost
+        self.enqueued = enqueued
+        self.attempt_enqueued = time.monotonic()
+        self.future = future
+        self.request_id = request_id.get()  # dispatch runs in other requests' context
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the chat completions API.
+
+    Requests wait in priority order (PRIORITY_*; FIFO within a priority)
+    for one of `max_concurrency` slots and for their model's rate-limit
+    budget (`limits`: model -> (requests/min, tokens/min), estimated as
+    prompt + max_tokens and corrected from the response's usage). A request
+    blocked on a model's budget does not let lower-priority requests for the
+    same model overtake it.
+
+    A request that has waited `fallback_after` seconds, counted from its
+    first attempt, is sent to `fallback_model` instead. Rate-limit,
+    connection and 5xx errors are retried up to `max_retries` times after a
+    full-jitter exponential backoff (or the provider's retry-after); a 429
+    also pauses that model's budget for everyone. Each attempt is given
+    `attempt_timeout` seconds, so one hung call does not use up the
+    caller's whole deadline.
+
+    `create` is the SDK call, e.g. `client.chat.completions.create`.
+    """
+
+    def __init__(
+        self,
+        create,
+        max_concurrency: int = 8,
+        limits: dict = None,
+        fallback_model: str = None,
+        fallback_after: float = 4.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        attempt_timeout: float = None,
+    ):
+        self.create = create
+        self.max_concurrency = max_concurrency
+        self.limits = {
+            model: ModelLimits(requests, tokens)
+            for model, (requests, tokens) in (limits or {}).items()
+        }
+        self.fallback_model = fallback_model
+        self.fallback_after = fallback_after
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+
+        self.active = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self.completed = 0
+        self._waiting = []  # sorted by (priority, seq)
+        self._seq = itertools.count()
+        self._timer = None
+
+    def _limits_for(self, model: str) -> ModelLimits:
+        if model not in self.limits:
+            self.limits[model] = ModelLimits(0, 0)
+        return self.limits[model]
+
+    # -- admission --
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        blocked = set()
+        recheck = None
+
+        for waiter in list(self._waiting):
+            if waiter.future.done():
+                # Cancelled; its task has not run its cleanup yet.
+                self._waiting.remove(waiter)
+                continue
+            if self.active >= self.max_concurrency:
+                break
+
+            if (
+                self.fallback_model
+                and waiter.model != self.fallback_model
+                and now - waiter.enqueued >= self.fallback_after
+            ):
+                logger.debug(
+                    "LLM request moved to fallback model",
+                    extra={"model": waiter.model, "fallback": self.fallback_model,
+                           "waited_s": round(now - waiter.enqueued, 2), "request_id": waiter.request_id},
+                )
+                waiter.model = self.fallback_model
+                self.fallbacks += 1
+                LLM_FALLBACKS.inc()
+
+            if waiter.model in blocked:
+                continue
+
+            limits = self._limits_for(waiter.model)
+            delay = limits.delay(waiter.cost, now)
+            if delay > 0:
+                blocked.add(waiter.model)
+                recheck = delay if recheck is None else min(recheck, delay)
+                continue
+
+            limits.take(waiter.cost, now)
+            self._waiting.remove(waiter)
+            self.active += 1
+            LLM_REQUESTS_IN_FLIGHT.inc()
+            LLM_QUEUE_WAIT.observe(now - waiter.attempt_enqueued, PRIORITY_NAMES[waiter.priority])
+            waiter.future.set_result(waiter.model)
+
+        # Wake up for the next fallback deadline of a rate-limited request.
+        if self.fallback_model:
+            for waiter in self._waiting:
+                if waiter.model in blocked and waiter.model != self.fallback_model:
+                    deadline = self.fallback_after - (now - waiter.enqueued)
+                    recheck = deadline if recheck is None else min(recheck, deadline)
+
+        LLM_QUEUE_DEPTH.set(len(self._waiting))
+        if recheck is not None and self._waiting:
+            self._timer = asyncio.get_running_loop().call_later(max(recheck, 0.001), self._dispatch)
+
+    async def _acquire(self, priority: int, model: str, cost: int, enqueued: float) -> str:
+        """
+        Wait for a slot and budget; returns the model to call.
+        """
+        waiter = _Waiter(priority, next(self._seq), model, cost, enqueued,
+                         asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiting, waiter)
+        self._dispatch()
+
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+                LLM_QUEUE_DEPTH.set(len(self._waiting))
+            elif waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # granted just before the cancel landed
+            raise
+
+    def release(self):
+        self.active -= 1
+        LLM_REQUESTS_IN_FLIGHT.dec()
+        self._dispatch()
+
+    # -- errors --
+
+    def _backoff(self, attempt: int, error) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(error))
+
+    async def _attempt(self, **kwargs):
+        if not self.attempt_timeout:
+            return await self.create(**kwargs)
+        return await asyncio.wait_for(self.create(**kwargs), self.attempt_timeout)
+
+    def _should_retry(self, model: str, error, attempt: int) -> bool:
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            return False
+
+        if isinstance(error, groq.RateLimitError):
+            self._limits_for(model).pause(retry_after(error) or self.backoff_base, time.monotonic())
+
+        self.retries += 1
+        LLM_RETRIES.inc(type(error).__name__)
+        logger.warning(
+            "LLM request failed, retrying",
+            extra={"model": model, "attempt": attempt + 1, "error": str(error) or type(error).__name__},
+        )
+        return True
+
+    def _settle(self, model: str, cost: int, response):
+        # Give back what the estimate over-reserved.
+        usage = getattr(response, "usage", None)
+        used = getattr(usage, "total_tokens", None)
+        if isinstance(used, int) and used < cost:
+            self._limits_for(model).tokens.give_back(cost - used)
+        self.completed += 1
+
+    # -- public API --
+
+    async def complete(self, priority: int = PRIORITY_NORMAL, **kwargs):
+        """
+        `create(**kwargs)` once admitted, with the model possibly replaced
+        by the fallback and with retries.
+        """
+        cost = estimate_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+        enqueued = time.monotonic()
+
+        for attempt in itertools.count():
+            model = await self._acquire(priority, kwargs["model"], cost, enqueued)
+            try:
+                response = await self._attempt(**{**kwargs, "model": model})
+            except Exception as e:
+                self.release()
+                if not self._should_retry(model, e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                self.release()
+                raise
+
+            self._settle(model, cost, response)
+            self.release()
+            return response
+
+    async def open_stream(self, priority: int = PRIORITY_NORMAL, **kwargs):
+        """
+        Start a streamed completion. Only opening the stream is retried.
+        The caller holds a slot until it calls `release()`.
+        """
+        cost = estimate_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+        enqueued = time.monotonic()
+
+        for attempt in itertools.count():
+            model = await self._acquire(priority, kwargs["model"], cost, enqueued)
+            try:
+                stream = await self._attempt(**{**kwargs, "model": model, "stream": True})
+            except Exception as e:
+                self.release()
+                if not self._should_retry(model, e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            except BaseException:
+                self.release()
+                raise
+
+            self.completed += 1
+            return stream
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiting),
+            "waiting_by_priority": {
+                name: sum(1 for waiter in self._waiting if waiter.priority == priority)
+                for priority, name in PRIORITY_NAMES.items()
+            },
+            "completed": self.completed,
+            "retries": self.retries,
+            "fallbacks": self.fallbacks,
+        }
@@ -1,20 +1,58 @@
-from fastapi import FastAPI
+from fastapi import BackgroundTasks, FastAPI
 from pydantic import BaseModel
-from app.llm import get_medical_response
-from app.database import get_user_city, init_db, save_user_city
-from app.agents import medical_graph
+from app.llm import load_context, response_cache, start_retrieval
+from app.database import init_db
+from app.agents import medical_graph, MCP_SERVER_PATH
+from app.config import (
+    MCP_POOL_SIZE,
+    MCP_CALL_TIMEOUT,
+    MCP_CONNECT_TIMEOUT,
+    MCP_HEALTH_CHECK_INTERVAL,
+    PERSIST_SHUTDOWN_TIMEOUT,
+    HISTORY_IDLE_DAYS,
+    HISTORY_COMPACT_INTERVAL,
+    HISTORY_COMPACT_BATCH,
+    HISTORY_COMPRESS_LEVEL,
+    HISTORY_VACUUM,
+    HISTORY_VACUUM_MAX_PAGES,
+    INTENT_FAST_PATH_ENABLED,
+    INTENT_THRESHOLD,
+    INTENT_MARGIN,
+    INTENT_MAX_WORDS,
+    LOG_LEVEL,
+    LOG_FORMAT,
+)
+from app.intent import IntentClassifier
+from app.matching import load_city_matcher
+from app.mcp_client import MCPSessionPool
+from app.persistence import write_queue
+from app.retention import HistoryCompactor
+from app.streaming import stream_chat
+from app.summarizer import SummaryWorker
+from app.telemetry import (
+    CONTENT_TYPE,
+    REGISTRY,
+    WRITE_QUEUE_DEPTH,
+    MetricsMiddleware,
+    configure_logging,
+    refresh_component_metrics,
+)
+from starlette.background import BackgroundTask
 from typing import Optional
 import asyncio
+import os
 from app.rag import MedicalRAG
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 
 
 templates = Jinja2Templates(directory="templates")
 
+configure_logging(LOG_LEVEL, LOG_FORMAT)
 
 app = FastAPI(title="Medical AI Chatbot")
+app.add_middleware(MetricsMiddleware)
 
 init_db()
 
@@ -22,14 +60,23 @@ class ChatRequest(BaseModel):
     session_id: str
     message: str
     city: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
+# Detected even before the hospital data covers them.
 KNOWN_CITIES = ["Hyderabad", "Bangalore", "Mumbai", "Delhi"]
 
+# Cities in the MCP server's hospital data plus KNOWN_CITIES, their aliases
+# and hospital localities, compiled once into a single matcher.
+MCP_DATA_DIR = os.path.join(os.path.dirname(MCP_SERVER_PATH), "data")
+CITY_MATCHER = load_city_matcher(
+    os.path.join(MCP_DATA_DIR, "hospitals.json"),
+    os.path.join(MCP_DATA_DIR, "city_aliases.json"),
+    KNOWN_CITIES,
+)
+
 def detect_city_from_message(message: str):
-    for city in KNOWN_CITIES:
-        if city.lower() in message.lower():
-            return city
-    return None
+    return CITY_MATCHER.first(message)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -37,37 +84,55 @@ async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
-@app.post("/chat", response_class=PlainTextResponse)
-async def chat_endpoint(request: ChatRequest):
+async def build_chat_state(request: ChatRequest) -> dict:
 
     message = request.message
     city = request.city
 
+    # Retrieval only needs the message: let it run while the history loads.
+    retrieval = start_retrieval(rag, message)
+
+    # Profile, summary and recent history in one read transaction, once
+    # this session's previous turn has left the write queue.
+    await write_queue.await_session(request.session_id)
+    context = await asyncio.to_thread(load_context, request.session_id)
+
     if not city:
         detected_city = detect_city_from_message(message)
         if detected_city:
             city = detected_city
 
-    # If user sent city → save it
-    if city:
-        save_user_city(request.session_id, city)
+    # If user sent a new city → save it
+    if city and city != context["city"]:
+        write_queue.save_user_city(request.session_id, city)
 
-    # If no city → try loading from DB
+    # If no city → use the one stored in the profile
     if not city:
-        city = get_user_city(request.session_id)
+        city = context["city"]
 
-    
-
-    state = {
+    return {
         "session_id": request.session_id,
         "message": request.message,
         "city": city,
+        "latitude": request.latitude,
+        "longitude": request.longitude,
         "rag": rag,
+        "mcp_pool": mcp_pool,
+        "intent_classifier": intent_classifier,
+        "session_context": context,
+        "retrieval": retrieval,
+        "hospital_prefetch": None,
         "llm_output": {},
         "hospital_info": None,
         "final_output": {}
     }
 
+
+@app.post("/chat", response_class=PlainTextResponse)
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
+
+    state = await build_chat_state(request)
+
     result = await medical_graph.ainvoke(state)
 
     final = result["final_output"]
@@ -75,13 +140,84 @@ async def chat_endpoint(request: ChatRequest):
     if isinstance(final, dict):
         final = str(final)
 
+    background_tasks.add_task(summary_worker.enqueue, request.session_id)
+
     return final
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    WRITE_QUEUE_DEPTH.set(write_queue.stats()["queued"])
+    refresh_component_metrics(
+        response_cache=response_cache,
+        embedding_cache=rag.query_cache if rag is not None else None,
+        intent_classifier=intent_classifier,
+        compactor=history_compactor,
+    )
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+
+    state = await build_chat_state(request)
+
+    return StreamingResponse(
+        stream_chat(state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(summary_worker.enqueue, request.session_id),
+    )
+
+
 rag = None
+mcp_pool = None
+intent_classifier = None
+summary_worker = SummaryWorker()
+history_compactor = HistoryCompactor(
+    idle_days=HISTORY_IDLE_DAYS,
+    interval=HISTORY_COMPACT_INTERVAL,
+    batch_size=HISTORY_COMPACT_BATCH,
+    compress_level=HISTORY_COMPRESS_LEVEL,
+    vacuum=HISTORY_VACUUM,
+    vacuum_max_pages=HISTORY_VACUUM_MAX_PAGES,
+)
 
 @app.on_event("startup")
 async def startup_event():
-    global rag
+    global rag, mcp_pool, intent_classifier
     rag = MedicalRAG()
-    rag.initialize()
\ No newline at end of file
+    rag.initialize()
+
+    if INTENT_FAST_PATH_ENABLED:
+        intent_classifier = IntentClassifier(
+            rag,
+            threshold=INTENT_THRESHOLD,
+            margin=INTENT_MARGIN,
+            max_words=INTENT_MAX_WORDS,
+        )
+
+    mcp_pool = MCPSessionPool(
+        MCP_SERVER_PATH,
+        size=MCP_POOL_SIZE,
+        call_timeout=MCP_CALL_TIMEOUT,
+        connect_timeout=MCP_CONNECT_TIMEOUT,
+        health_check_interval=MCP_HEALTH_CHECK_INTERVAL,
+    )
+    await mcp_pool.start()
+
+    write_queue.start()
+    summary_worker.start()
+    history_compactor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await history_compactor.close()
+    await summary_worker.close()
+
+    # Flush queued turns and profile updates before the process exits.
+    await asyncio.to_thread(write_queue.close, PERSIST_SHUTDOWN_TIMEOUT)
+
+    if mcp_pool is not None:
+        await mcp_pool.close()
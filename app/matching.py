@@ -0,0 +1,150 @@
+import json
+from collections import deque
+
+
+# ---------------------------
+# Multi-Phrase Matching
+# ---------------------------
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase, straighten apostrophes and collapse runs of whitespace, so
+    "New  Delhi" and "can’t" match the phrases "new delhi" and "can't".
+    """
+    return " ".join(text.lower().replace("’", "'").split())
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class PhraseMatcher:
+    """
+    Aho–Corasick automaton over a fixed set of phrases, each mapped to a
+    value. A message is scanned once, whatever the number of phrases, and a
+    phrase only counts as a whole word or words: "delhi" matches "in delhi,"
+    but not "delhiite".
+
+    Phrases and messages go through `normalize_text` first. When matches
+    overlap, the leftmost wins, then the longest ("new delhi" over "delhi").
+    """
+
+    def __init__(self, phrases: dict):
+        # Node 0 is the root. `outputs[node]` holds (length, value) for every
+        # phrase ending at that node, its own first, then its suffixes'. A
+        # phrase repeated after normalization keeps the last value.
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+
+        for phrase, value in phrases.items():
+            phrase = normalize_text(phrase)
+            if not phrase:
+                continue
+            node = 0
+            for char in phrase:
+                child = self._goto[node].get(char)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][char] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                node = child
+            self._outputs[node] = [(len(phrase), value)]
+
+        self.size = sum(1 for outputs in self._outputs if outputs)
+
+        # Breadth-first, so every failure target is complete before use.
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                pending.append(child)
+
+    @classmethod
+    def from_phrases(cls, phrases, value=True):
+        return cls({phrase: value for phrase in phrases})
+
+    def _scan(self, text: str):
+        """
+        Yield (start, end, value) for every whole-word match, in order of
+        their end position.
+        """
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            if not self._outputs[node]:
+                continue
+            end = index + 1
+            if end < len(text) and _is_word_char(text[end]):
+                continue
+            for length, value in self._outputs[node]:
+                start = end - length
+                if start == 0 or not _is_word_char(text[start - 1]):
+                    yield start, end, value
+
+    def contains(self, text: str) -> bool:
+        return next(self._scan(normalize_text(text)), None) is not None
+
+    def find_all(self, text: str) -> list:
+        """
+        Non-overlapping matches as (start, end, value), left to right;
+        offsets refer to the normalized text.
+        """
+        matches = sorted(self._scan(normalize_text(text)), key=lambda match: (match[0], -match[1]))
+        selected = []
+        for match in matches:
+            if not selected or match[0] >= selected[-1][1]:
+                selected.append(match)
+        return selected
+
+    def first(self, text: str):
+        """
+        The value of the leftmost (then longest) match, or None.
+        """
+        matches = self.find_all(text)
+        return matches[0][2] if matches else None
+
+
+def build_city_matcher(hospitals_by_city: dict, aliases: dict, extra_cities=()) -> PhraseMatcher:
+    """
+    Phrases naming a city, mapped to its name as written in hospitals.json
+    (or `extra_cities`, for cities without hospital data yet): the name
+    itself, every alias pointing at it, and the localities in its
+    hospitals' addresses ("Jubilee Hills, Hyderabad").
+    """
+    cities = {normalize_text(city): city for city in extra_cities}
+    cities.update({normalize_text(city): city for city in hospitals_by_city})
+    phrases = {}
+
+    for city, hospitals in hospitals_by_city.items():
+        for hospital in hospitals:
+            parts = [part.strip() for part in hospital.get("address", "").split(",")]
+            for part in parts:
+                if part and normalize_text(part) not in cities:
+                    phrases.setdefault(part, city)
+
+    for alias, target in aliases.items():
+        if normalize_text(target) in cities:
+            phrases[alias] = cities[normalize_text(target)]
+
+    # Exact city names take precedence over anything else spelled the same.
+    phrases.update({city: city for city in cities.values()})
+    return PhraseMatcher(phrases)
+
+
+def load_city_matcher(hospitals_path: str, aliases_path: str, extra_cities=()) -> PhraseMatcher:
+    with open(hospitals_path, "r") as f:
+        hospitals_by_city = json.load(f)
+    with open(aliases_path, "r") as f:
+        aliases = json.load(f)
+    return build_city_matcher(hospitals_by_city, aliases, extra_cities)
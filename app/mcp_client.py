@@ -1,7 +1,12 @@
+import asyncio
+import logging
 import sys
+from contextlib import asynccontextmanager
 from mcp.client.stdio import stdio_client, StdioServerParameters
 from mcp.client.session import ClientSession
 
+logger = logging.getLogger(__name__)
+
 
 class MCPClient:
 
@@ -38,3 +43,196 @@ class MCPClient:
         if self.session_ctx is not None:
             await self.session_ctx.__aexit__(None, None, None)
             self.session_ctx = None
+
+
+# ---------------------------
+# Pooled MCP Sessions
+# ---------------------------
+
+class PooledMCPSession:
+    """
+    One long-lived MCP server process + session.
+
+    The stdio transport and ClientSession are anyio context managers, so they
+    must be entered and exited by the same task. Each pooled session therefore
+    owns a background task that keeps both contexts open until close().
+    """
+
+    def __init__(self, server_script_path: str):
+        self.server_script_path = server_script_path
+        self.session = None
+        self._task = None
+        self._ready = None
+        self._closing = None
+        self._error = None
+
+    async def connect(self, timeout: float):
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error = None
+        self._task = asyncio.create_task(self._run())
+
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+        if self.session is None:
+            raise RuntimeError(f"MCP server failed to start: {self._error}")
+
+    async def _run(self):
+        try:
+            async with stdio_client(
+                StdioServerParameters(
+                    command=sys.executable,
+                    args=[self.server_script_path]
+                )
+            ) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self.session is not None
+            and self._task is not None
+            and not self._task.done()
+        )
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def call_tool(self, tool_name: str, arguments: dict):
+        return await self.session.call_tool(tool_name, arguments)
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except Exception:
+            self._task.cancel()
+        self._task = None
+        self.session = None
+
+
+class MCPSessionPool:
+    """
+    Fixed-size pool of connected MCP sessions, created once at startup.
+
+    Callers borrow a session with `acquire()` (or use `call_tool()` directly).
+    Dead sessions are respawned on checkout and by a periodic health check;
+    a session that times out or errors mid-call is discarded and replaced.
+    `call_timeout` bounds a whole `call_tool()`: waiting for a free session,
+    respawning it if needed and the call itself.
+    """
+
+    def __init__(
+        self,
+        server_script_path: str,
+        size: int = 2,
+        call_timeout: float = 10.0,
+        connect_timeout: float = 20.0,
+        health_check_interval: float = 30.0,
+    ):
+        self.server_script_path = server_script_path
+        self.size = max(1, size)
+        self.call_timeout = call_timeout
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+
+        self._sessions = []
+        self._idle = asyncio.Queue()
+        self._health_task = None
+        self._closed = False
+
+    async def start(self):
+        for _ in range(self.size):
+            session = PooledMCPSession(self.server_script_path)
+            self._sessions.append(session)
+            try:
+                await session.connect(self.connect_timeout)
+            except Exception as e:
+                # Keep the slot; it will be respawned on first checkout.
+                logger.warning("MCP session failed to start", extra={"error": str(e)})
+            self._idle.put_nowait(session)
+
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _respawn(self, session: PooledMCPSession):
+        await session.close()
+        await session.connect(self.connect_timeout)
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError("MCP session pool is closed")
+
+        session = await self._idle.get()
+        try:
+            if not session.alive:
+                await self._respawn(session)
+            yield session
+        except BaseException:
+            # State of the session is unknown (timeout, broken pipe, cancel);
+            # drop the server process so the next borrower gets a fresh one.
+            await session.close()
+            raise
+        finally:
+            self._idle.put_nowait(session)
+
+    async def call_tool(self, tool_name: str, arguments: dict):
+        return await asyncio.wait_for(
+            self._call_tool(tool_name, arguments),
+            self.call_timeout
+        )
+
+    async def _call_tool(self, tool_name: str, arguments: dict):
+        async with self.acquire() as session:
+            return await session.call_tool(tool_name, arguments)
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+
+            # Only check sessions that are idle right now.
+            for _ in range(self._idle.qsize()):
+                try:
+                    session = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                try:
+                    if not await session.ping(self.call_timeout):
+                        await self._respawn(session)
+                except Exception as e:
+                    logger.warning("MCP session respawn failed", extra={"error": str(e)})
+                finally:
+                    self._idle.put_nowait(session)
+
+    async def close(self):
+        self._closed = True
+
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+        for session in self._sessions:
+            await session.close()
+        self._sessions = []
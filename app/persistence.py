@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.config import PERSIST_FLUSH_INTERVAL, PERSIST_MAX_BATCH
+from app.database import encode_assistant_message, write_batch
+from app.telemetry import ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Write-Behind Persistence
+# ---------------------------
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Takes chat turns and profile updates off the request path.
+
+    Writes are queued in memory and a background thread commits them in
+    batches: it waits up to `flush_interval` seconds after the first queued
+    write for more to arrive, then writes at most `max_batch` operations in
+    one transaction. Until start() is called, writes go straight to the
+    database on the caller's thread.
+
+    Reads that must see a session's own writes (the next turn's history, a
+    summary refresh) call await_session() first; it only blocks while that
+    session still has queued writes.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, max_batch: int = 256):
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, max_batch)
+
+        self.batches = 0
+        self.operations = 0
+        self.failures = 0
+        self.largest_batch = 0
+
+        self._queue = queue.Queue()
+        self._pending = Counter()  # session_id -> queued operations
+        self._done = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def save_turn(self, session_id: str, user_message: str, parsed: dict):
+        # Timestamps are taken now, not at flush time, so history order
+        # follows the order requests completed in.
+        now = datetime.utcnow()
+        rows = [
+            {"session_id": session_id, "role": "user", "message": user_message, "timestamp": now},
+            {
+                "session_id": session_id,
+                "role": "assistant",
+                "message": encode_assistant_message(parsed),
+                "timestamp": now + timedelta(microseconds=1),
+            },
+        ]
+        self._submit(session_id, ("turn", rows))
+
+    def save_user_city(self, session_id: str, city: str):
+        self._submit(session_id, ("city", city))
+
+    def _submit(self, session_id: str, operation):
+        if self._thread is None:
+            self._write([(session_id, operation)])
+            return
+
+        with self._done:
+            self._pending[session_id] += 1
+        self._queue.put((session_id, operation))
+
+    def wait_session(self, session_id: str, timeout: float = None) -> bool:
+        with self._done:
+            return self._done.wait_for(lambda: not self._pending[session_id], timeout)
+
+    async def await_session(self, session_id: str, timeout: float = 5.0):
+        if not self._pending.get(session_id):
+            return
+        if not await asyncio.to_thread(self.wait_session, session_id, timeout):
+            logger.warning("Write-behind: timed out waiting for session", extra={"session_id": session_id})
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            logger.warning("Write-behind batch failed, retrying one by one", extra={"error": str(e), "batch_size": len(batch)})
+            for item in batch:
+                try:
+                    self._write([item])
+                except Exception as e:
+                    self.failures += 1
+                    ERRORS.inc("persistence")
+                    logger.error("Write-behind dropped a write", extra={"session_id": item[0], "error": str(e)})
+        finally:
+            with self._done:
+                for session_id, _ in batch:
+                    self._pending[session_id] -= 1
+                    if not self._pending[session_id]:
+                        del self._pending[session_id]
+                self._done.notify_all()
+
+        self.batches += 1
+        self.operations += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+    @staticmethod
+    def _write(batch):
+        rows = []
+        cities = {}
+        for session_id, (kind, payload) in batch:
+            if kind == "turn":
+                rows += payload
+            else:
+                cities[session_id] = payload  # last update wins
+
+        write_batch(rows, cities)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Flush everything queued so far and stop the writer thread.
+        """
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("Write-behind stopped with writes pending", extra={"pending": self._queue.qsize()})
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "operations": self.operations,
+            "largest_batch": self.largest_batch,
+            "failures": self.failures,
+        }
+
+
+write_queue = WriteBehindQueue(PERSIST_FLUSH_INTERVAL, PERSIST_MAX_BATCH)
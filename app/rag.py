@@ -1,71 +1,428 @@
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 import faiss
+import hashlib
+import itertools
+import json
+import logging
 import os
 import numpy as np
 import pickle
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from app.batching import MicroBatcher
+from app.chunk_store import ChunkStore, current_prefix, generation_prefix, new_generation, publish_generation
+from app.embeddings import EMBEDDING_BACKEND, load_embedding_model
+from app.sparse_index import BM25Index, reciprocal_rank_fusion
+from app.telemetry import span
+from app.vector_index import (
+    DEFAULT_INDEX_PARAMS,
+    SEARCH_PARAMS,
+    apply_search_params,
+    IndexWriter,
+    remove_ids,
+    env_index_params,
+    env_index_type,
+    load_index_meta,
+    save_index_meta,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATA_PATH = "data/disease_guidelines"
 INDEX_PATH = "data/faiss_index"
 EMBEDDING_MODEL_NAME = os.getenv(
     "EMBEDDING_MODEL_NAME",
     "sentence-transformers/all-MiniLM-L6-v2"
 )
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+CHUNKING = {"chunk_size": 250, "chunk_overlap": 50}
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1").lower() not in ("0", "false", "no")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+# "dense": FAISS only. "sparse": BM25 only. "hybrid": both, merged with
+# weighted reciprocal rank fusion over RETRIEVAL_CANDIDATES hits per side.
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Concurrent retrieve() / embed_query() calls are encoded and searched
+# together: a batch closes at EMBED_BATCH_SIZE queries or after waiting
+# EMBED_BATCH_MAX_WAIT_MS for company. EMBED_BATCH_SIZE=1 disables it.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "2"))
+
+# Index files of the unversioned layout, from before index generations
+# (see app.chunk_store). _docs.pkl ships with the repository and is kept.
+LEGACY_INDEX_FILES = (
+    ".index", "_meta.json", "_manifest.json",
+    "_chunks.bin", "_chunks.ids.npy", "_chunks.offsets.npy",
+    "_bm25.vocab.json", "_bm25.offsets.npy", "_bm25.docs.npy",
+    "_bm25.tfs.npy", "_bm25.doc_ids.npy", "_bm25.doc_lens.npy",
+)
+
+
+def parse_pdf(path: str):
+    """
+    Load and split one PDF into chunk texts. Runs in ingestion workers.
+    """
+    loader = PyMuPDFLoader(path)
+    splitter = RecursiveCharacterTextSplitter(**CHUNKING)
+    return [doc.page_content for doc in splitter.split_documents(loader.load())]
+
+
+def parse_pdfs(paths, workers: int):
+    """
+    Yield (path, chunk texts) in order, parsing up to `workers` PDFs in
+    parallel. At most 2 * workers parsed files are held at once.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield path, parse_pdf(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(paths)
+        pending = deque(
+            (path, executor.submit(parse_pdf, path))
+            for path in itertools.islice(remaining, workers * 2)
+        )
+
+        while pending:
+            path, future = pending.popleft()
+            texts = future.result()
+
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(parse_pdf, next_path)))
+
+            yield path, texts
+
+
+def read_faiss_index(path: str, index_type: str, mmap: bool):
+    if mmap:
+        # IVF inverted lists and flat/HNSW vector storage use different
+        # mmap flags in FAISS; fall back to a private copy if unsupported.
+        flag = faiss.IO_FLAG_MMAP if index_type in ("ivf", "ivfpq") else faiss.IO_FLAG_MMAP_IFC
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning("Memory-mapped index load failed, reading into memory", extra={"error": str(e)})
+
+    return faiss.read_index(path)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of normalized query -> embedding vector.
+    Thread-safe, since retrieval runs in the default thread pool.
+    """
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
 
 class MedicalRAG:
 
-    def __init__(self):
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    def __init__(
+        self,
+        index_type: str = None,
+        embedding_backend: str = None,
+        retrieval_mode: str = None,
+        **index_params
+    ):
+        """
+        `embedding_backend` overrides EMBEDDING_BACKEND (see app.embeddings),
+        `retrieval_mode` overrides RETRIEVAL_MODE.
+        `index_type` / `index_params` override INDEX_TYPE and INDEX_* settings
+        (see app.vector_index). Search parameters (nprobe, ef_search) given
+        here also override the values saved with an existing index.
+        """
+        self.embedding_backend = embedding_backend or EMBEDDING_BACKEND
+        self.embedding_model = load_embedding_model(EMBEDDING_MODEL_NAME, self.embedding_backend)
         self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         self.index = None
         self.documents = []
+        self.sparse_index = None
+        self.query_cache = EmbeddingCache()
 
-    def load_documents(self):
-        all_docs = []
+        self.retrieval_mode = (retrieval_mode or RETRIEVAL_MODE).lower()
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {self.retrieval_mode!r}; expected one of {RETRIEVAL_MODES}")
 
-        for file in os.listdir(DATA_PATH):
-            if file.endswith(".pdf"):
-                loader = PyMuPDFLoader(os.path.join(DATA_PATH, file))
-                docs = loader.load()
-                all_docs.extend(docs)
+        self._configured_type = (index_type or env_index_type()).lower()
+        self._param_overrides = {**env_index_params(), **index_params}
 
-        return all_docs
+        self.index_type = self._configured_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **self._param_overrides}
 
-    def split_documents(self, documents):
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=250,
-            chunk_overlap=50
+        self.batcher = (
+            MicroBatcher(self._run_batch, "rag", EMBED_BATCH_SIZE, EMBED_BATCH_MAX_WAIT_MS)
+            if EMBED_BATCH_SIZE > 1 else None
         )
-        return splitter.split_documents(documents)
 
-    def create_index(self):
+    def create_index(self, force: bool = False):
+        """
+        Build or incrementally update the index.
 
-        documents = self.load_documents()
-        split_docs = self.split_documents(documents)
+        A manifest maps each PDF's content hash to the contiguous range of
+        vector IDs its chunks were stored under. Only new or changed PDFs are
+        embedded; vectors of changed or deleted PDFs are removed by ID. The
+        index is rebuilt from scratch when `force` is set or when the model,
+        index type or build parameters no longer match the manifest.
 
-        texts = [doc.page_content for doc in split_docs]
-        embeddings = self.embedding_model.encode(texts, normalize_embeddings=True)
+        Everything is written to a new index generation and published in
+        one step, so workers serving the current one are left untouched.
+        """
 
-        dimension = embeddings.shape[1]
+        build_params = {
+            key: value for key, value in self.index_params.items()
+            if key not in SEARCH_PARAMS
+        }
+        build_config = {
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "embedding_backend": self.embedding_backend,
+            "index_type": self._configured_type,
+            "build_params": build_params,
+            "chunking": CHUNKING,
+        }
 
-        self.index = faiss.IndexFlatIP(dimension)
-        self.index.add(np.array(embeddings))
+        manifest = None if force else load_manifest(f"{current_prefix(INDEX_PATH)}_manifest.json")
+        if manifest and manifest.get("config") == build_config:
+            self.load_index(mmap=False)
+        else:
+            manifest = None
 
-        self.documents = texts
+        if manifest is None or self.index is None or not isinstance(self.documents, ChunkStore):
+            # No compatible ID-mapped index to update; start from scratch.
+            manifest = {"config": build_config, "next_id": 0, "files": {}}
+            self.index = None
+            self.documents = {}
 
-        # Save index
-        faiss.write_index(self.index, f"{INDEX_PATH}.index")
+        old_chunks = self.documents if isinstance(self.documents, ChunkStore) else None
 
-        with open(f"{INDEX_PATH}_docs.pkl", "wb") as f:
-            pickle.dump(self.documents, f)
+        self.index_type = self._configured_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **self._param_overrides}
 
-    def load_index(self):
-        if os.path.exists(f"{INDEX_PATH}.index"):
-            self.index = faiss.read_index(f"{INDEX_PATH}.index")
+        current_files = {
+            file: file_sha256(os.path.join(DATA_PATH, file))
+            for file in sorted(os.listdir(DATA_PATH))
+            if file.endswith(".pdf")
+        }
+
+        stale_ids = []
+        for file, entry in list(manifest["files"].items()):
+            if current_files.get(file) != entry["sha256"]:
+                stale_ids.extend(range(*entry["ids"]))
+                del manifest["files"][file]
+
+        new_files = [
+            file for file in current_files
+            if file not in manifest["files"]
+        ]
+
+        if not stale_ids and not new_files:
+            if self.sparse_index is None:
+                # Index built before BM25 was added.
+                generation = new_generation(INDEX_PATH)
+                ChunkStore.write(generation_prefix(INDEX_PATH, generation), self.documents.items())
+                self._publish(generation, manifest)
+            logger.info("Index is up to date.")
+            return
+
+        # Drop vectors of changed / deleted PDFs.
+        if stale_ids and self.index is not None:
+            self.index = remove_ids(self.index, stale_ids, self.index_type, self.index_params)
+
+        # Embed only new / changed PDFs. Kept chunks stream from the old
+        # store and new ones follow as their batches are indexed (new IDs are
+        # always larger), so the corpus is never held in memory at once.
+        writer = IndexWriter(self.index, self.index_type, self.index_params)
+
+        stale = set(stale_ids)
+        kept_chunks = (
+            (chunk_id, text) for chunk_id, text in (old_chunks.items() if old_chunks else [])
+            if chunk_id not in stale
+        )
+        new_chunks = self._ingest(new_files, current_files, manifest, writer)
+
+        generation = new_generation(INDEX_PATH)
+        ChunkStore.write(generation_prefix(INDEX_PATH, generation), itertools.chain(kept_chunks, new_chunks))
+
+        self.index = writer.finish()
+        if self.index is None:
+            # Corpus is empty; keep an empty index so retrieval still works.
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedding_dim))
+
+        self._publish(generation, manifest)
+
+    def _publish(self, generation, manifest):
+        """
+        Save the FAISS index, its meta, the BM25 index and the manifest next
+        to the chunk store already written to `generation`, then make that
+        generation current. Files a worker has memory-mapped are never
+        rewritten; the worker picks up the new generation on its next load.
+        """
+        prefix = generation_prefix(INDEX_PATH, generation)
+
+        faiss.write_index(self.index, f"{prefix}.index")
+        save_index_meta(f"{prefix}_meta.json", self.index_type, self.index_params)
+
+        self.documents = ChunkStore(prefix)
+        self._build_sparse_index(prefix)
+
+        save_manifest(f"{prefix}_manifest.json", manifest)
+        publish_generation(INDEX_PATH, generation, [f"{INDEX_PATH}{suffix}" for suffix in LEGACY_INDEX_FILES])
+
+    def _build_sparse_index(self, prefix: str):
+        # Rebuilt from the chunk store in one pass: tokenizing is cheap next
+        # to embedding, and BM25 statistics are corpus-wide anyway.
+        started = time.perf_counter()
+        BM25Index.build(prefix, self.documents.items())
+        self.sparse_index = BM25Index(prefix)
+        logger.info(
+            "BM25 index: %d chunks, %d terms in %.1fs",
+            len(self.sparse_index), len(self.sparse_index.terms), time.perf_counter() - started,
+        )
+
+    def _ingest(self, files, current_files, manifest, writer):
+        """
+        Parse PDFs in worker processes, embed their chunks in fixed-size
+        batches and add each batch to the index. Yields (id, text) for every
+        chunk once it is indexed.
+        """
+        paths = [os.path.join(DATA_PATH, file) for file in files]
+
+        batch_ids = []
+        batch_texts = []
+        total_chunks = 0
+        started = time.perf_counter()
+
+        def flush():
+            embeddings = self.embedding_model.encode(batch_texts, normalize_embeddings=True)
+            writer.add(embeddings, batch_ids)
+            chunks = list(zip(batch_ids, batch_texts))
+            batch_ids.clear()
+            batch_texts.clear()
+            return chunks
+
+        for files_done, (path, texts) in enumerate(parse_pdfs(paths, INGEST_WORKERS), 1):
+            file = os.path.basename(path)
+
+            first_id = manifest["next_id"]
+            manifest["next_id"] = first_id + len(texts)
+            manifest["files"][file] = {
+                "sha256": current_files[file],
+                "ids": [first_id, first_id + len(texts)],
+            }
+
+            for offset, text in enumerate(texts):
+                batch_ids.append(first_id + offset)
+                batch_texts.append(text)
+
+                if len(batch_texts) >= INGEST_BATCH_SIZE:
+                    chunks = flush()
+                    total_chunks += len(chunks)
+                    yield from chunks
+
+            elapsed = time.perf_counter() - started
+            logger.info(
+                "[%d/%d] %s: %d chunks (%d embedded, %.0f chunks/s)",
+                files_done, len(paths), file, len(texts), total_chunks, total_chunks / elapsed if elapsed else 0,
+            )
+
+        if batch_texts:
+            chunks = flush()
+            total_chunks += len(chunks)
+            yield from chunks
+
+        elapsed = time.perf_counter() - started
+        logger.info("Embedded %d chunks from %d files in %.1fs", total_chunks, len(paths), elapsed)
+
+    def load_index(self, mmap: bool = None):
+        """
+        With `mmap` (INDEX_MMAP, on by default) the FAISS index is opened
+        memory-mapped and read-only, so uvicorn workers share one copy
+        through the page cache. create_index loads it privately instead.
+        """
+        if mmap is None:
+            mmap = INDEX_MMAP
+
+        # Resolved once, so every file comes from the same build.
+        prefix = current_prefix(INDEX_PATH)
+
+        if os.path.exists(f"{prefix}.index"):
+            index_type, saved_params = load_index_meta(f"{prefix}_meta.json")
+            self.index = read_faiss_index(f"{prefix}.index", index_type, mmap)
 
             if self.index.d != self.embedding_dim:
                 # Index built with a different model; rebuild to avoid dimension mismatch.
@@ -73,18 +430,151 @@ class MedicalRAG:
                 self.documents = []
                 return
 
-            with open(f"{INDEX_PATH}_docs.pkl", "rb") as f:
-                self.documents = pickle.load(f)
+            # Restore the type and search settings the index was built with;
+            # explicitly configured search parameters take precedence.
+            self.index_type = index_type
+            self.index_params = {**DEFAULT_INDEX_PARAMS, **saved_params}
+            self.index_params.update({
+                key: value for key, value in self._param_overrides.items()
+                if key in SEARCH_PARAMS
+            })
+            apply_search_params(self.index, self.index_params)
+
+            if ChunkStore.exists(prefix):
+                self.documents = ChunkStore(prefix)
+                if BM25Index.exists(prefix):
+                    self.sparse_index = BM25Index(prefix)
+            elif os.path.exists(f"{INDEX_PATH}_docs.pkl"):
+                # Index built before the chunk store existed.
+                with open(f"{INDEX_PATH}_docs.pkl", "rb") as f:
+                    self.documents = pickle.load(f)
+            else:
+                self.index = None
+                self.documents = []
+
+    def embed_queries(self, queries):
+        """
+        Embed queries in one batch, serving repeated ones from the LRU cache.
+        """
+        keys = [normalize_query(q) for q in queries]
+        vectors = [None] * len(keys)
+        missing = {}
+
+        for i, key in enumerate(keys):
+            cached = self.query_cache.get(key)
+            if cached is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                vectors[i] = cached
+
+        if missing:
+            missing_keys = list(missing)
+            with span("embedding"):
+                embeddings = self.embedding_model.encode(missing_keys, normalize_embeddings=True)
+            for key, vector in zip(missing_keys, embeddings):
+                vector = np.asarray(vector, dtype="float32")
+                self.query_cache.put(key, vector)
+                for i in missing[key]:
+                    vectors[i] = vector
+
+        return np.vstack(vectors).astype("float32")
+
+    def embed_query(self, query):
+        if self.batcher is None:
+            return self.embed_queries([query])[0]
+        return self.batcher.submit((query, None))
 
     def retrieve(self, query, top_k=1):
-        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True)
-        distances, indices = self.index.search(np.array(query_embedding), top_k)
+        if self.batcher is None:
+            return self.retrieve_many([query], top_k)[0]
+        return self.batcher.submit((query, top_k))
+
+    def _run_batch(self, requests):
+        """
+        Micro-batch handler. Requests are (query, top_k), with top_k None
+        for embedding only. Every query is encoded in one call; retrievals
+        then share one search per distinct top_k.
+        """
+        results = [None] * len(requests)
+
+        encode = [
+            i for i, (_, top_k) in enumerate(requests)
+            if top_k is None or self.retrieval_mode != "sparse"
+        ]
+        vectors = {}
+        if encode:
+            embeddings = self.embed_queries([requests[i][0] for i in encode])
+            vectors = dict(zip(encode, embeddings))
+
+        groups = {}
+        for i, (_, top_k) in enumerate(requests):
+            if top_k is None:
+                results[i] = vectors[i]
+            else:
+                groups.setdefault(top_k, []).append(i)
+
+        for top_k, positions in groups.items():
+            found = self.retrieve_many(
+                [requests[i][0] for i in positions],
+                top_k,
+                np.vstack([vectors[i] for i in positions]) if positions[0] in vectors else None,
+            )
+            for i, chunks in zip(positions, found):
+                results[i] = chunks
 
-        results = [self.documents[i] for i in indices[0]]
         return results
-    
+
+    def retrieve_many(self, queries, top_k=1, query_embeddings=None):
+        """
+        Encode and search all queries in a single batch.
+        Returns one list of chunks per query, in input order.
+        `query_embeddings` skips encoding when the caller already has them.
+        """
+        if not queries:
+            return []
+
+        mode = self.retrieval_mode
+        if mode != "dense" and self.sparse_index is None:
+            # Legacy index without BM25 files: dense only until rebuilt.
+            mode = "dense"
+
+        if mode == "sparse":
+            with span("bm25_search"):
+                rankings = [
+                    [chunk_id for chunk_id, _ in self.sparse_index.search(query, top_k)]
+                    for query in queries
+                ]
+            return [[self.documents[i] for i in ranking] for ranking in rankings]
+
+        candidates = top_k if mode == "dense" else max(top_k, RETRIEVAL_CANDIDATES)
+
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        with span("faiss_search"):
+            distances, indices = self.index.search(query_embeddings, candidates)
+
+        if mode == "dense":
+            return [
+                [self.documents[i] for i in row if i != -1]
+                for row in indices
+            ]
+
+        results = []
+        for query, row in zip(queries, indices):
+            dense = [int(i) for i in row if i != -1]
+            with span("bm25_search"):
+                sparse = [chunk_id for chunk_id, _ in self.sparse_index.search(query, candidates)]
+            fused = reciprocal_rank_fusion(
+                [dense, sparse],
+                [HYBRID_DENSE_WEIGHT, HYBRID_SPARSE_WEIGHT],
+                RRF_K,
+            )
+            results.append([self.documents[i] for i in fused[:top_k]])
+
+        return results
+
     def initialize(self):
-        if os.path.exists(f"{INDEX_PATH}.index"):
+        if os.path.exists(f"{current_prefix(INDEX_PATH)}.index"):
             self.load_index()
         if self.index is None:
             self.create_index()
\ No newline at end of file
@@ -0,0 +1,129 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ---------------------------
+# Semantic Response Cache
+# ---------------------------
+
+# Urgent answers are never cached: they should always get a fresh completion.
+BYPASS_SEVERITIES = ("high", "emergency")
+
+
+class SemanticResponseCache:
+    """
+    Caches parsed model responses for first-turn messages, keyed by the
+    normalized query embedding from MedicalRAG.
+
+    A lookup is a hit when the closest cached query has cosine similarity
+    >= `threshold` and has not outlived `ttl_seconds`. Entries are evicted
+    least-recently-used once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()  # id -> (vector, response, expires_at)
+        self._next_id = 0
+        self._matrix = None  # stacked vectors, rebuilt lazily after changes
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+
+    def _invalidate(self):
+        self._matrix = None
+        self._matrix_ids = []
+
+    def _purge_expired(self, now: float):
+        expired = [
+            entry_id for entry_id, (_, _, expires_at) in self._entries.items()
+            if expires_at <= now
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self.evictions += len(expired)
+            self._invalidate()
+
+    def lookup(self, vector):
+        """
+        Return a copy of the cached response for the closest query, or None.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._purge_expired(now)
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.vstack([self._entries[i][0] for i in self._matrix_ids])
+
+            scores = self._matrix @ np.asarray(vector, dtype="float32")
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return copy.deepcopy(self._entries[entry_id][1])
+
+    def store(self, vector, response: dict) -> bool:
+        """
+        Cache a response unless it is an error or high-severity result.
+        """
+        if "error" in response or response.get("severity_level") in BYPASS_SEVERITIES:
+            with self._lock:
+                self.bypasses += 1
+            return False
+
+        if self.max_entries <= 0:
+            return False
+
+        now = time.monotonic()
+
+        with self._lock:
+            self._purge_expired(now)
+
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            self._entries[self._next_id] = (
+                np.asarray(vector, dtype="float32"),
+                copy.deepcopy(response),
+                now + self.ttl_seconds,
+            )
+            self._next_id += 1
+            self._invalidate()
+
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
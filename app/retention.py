@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app.database import archive_session, find_idle_sessions, reclaim_space
+from app.telemetry import ERRORS, span
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# History Retention
+# ---------------------------
+
+class HistoryCompactor:
+    """
+    Keeps chat_history.db small by archiving idle sessions.
+
+    Every `interval` seconds, sessions with no message for `idle_days` are
+    moved into the compressed conversation_archives table, `batch_size`
+    sessions per query, each in its own short transaction so the
+    write-behind queue is never held up for long. Profiles and summaries
+    stay in place. Afterwards freed pages are handed back with an
+    incremental vacuum (or a full VACUUM, or not at all: `vacuum`).
+    """
+
+    def __init__(
+        self,
+        idle_days: float = 30,
+        interval: float = 3600,
+        batch_size: int = 200,
+        compress_level: int = 6,
+        vacuum: str = "incremental",
+        vacuum_max_pages: int = 0,
+    ):
+        self.idle_days = idle_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.compress_level = compress_level
+        self.vacuum = vacuum
+        self.vacuum_max_pages = vacuum_max_pages
+
+        self.runs = 0
+        self.sessions_archived = 0
+        self.messages_archived = 0
+        self.freed_bytes = 0
+        self.last_run_at = None
+        self._task = None
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                ERRORS.inc("compaction")
+                logger.warning("History compaction failed", extra={"error": str(e)})
+
+    async def run_once(self) -> dict:
+        idle_before = datetime.utcnow() - timedelta(days=self.idle_days)
+        sessions = messages = 0
+
+        with span("compaction"):
+            while True:
+                batch = await asyncio.to_thread(find_idle_sessions, idle_before, self.batch_size)
+                if not batch:
+                    break
+                for session_id in batch:
+                    # 0 when the user came back since the session was listed.
+                    moved = await asyncio.to_thread(archive_session, session_id, idle_before, self.compress_level)
+                    messages += moved
+                    sessions += bool(moved)
+
+            reclaimed = {"freed_bytes": 0}
+            if sessions and self.vacuum != "off":
+                reclaimed = await asyncio.to_thread(reclaim_space, self.vacuum, self.vacuum_max_pages)
+
+        self.runs += 1
+        self.sessions_archived += sessions
+        self.messages_archived += messages
+        self.freed_bytes += reclaimed["freed_bytes"]
+        self.last_run_at = datetime.utcnow()
+
+        result = {"sessions": sessions, "messages": messages, **reclaimed}
+        if sessions:
+            logger.info("Archived idle sessions", extra=result)
+        return result
+
+    async def close(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "sessions_archived": self.sessions_archived,
+            "messages_archived": self.messages_archived,
+            "freed_bytes": self.freed_bytes,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
@@ -0,0 +1,175 @@
+import array
+import json
+import os
+import re
+
+import numpy as np
+
+
+# ---------------------------
+# BM25 Sparse Index
+# ---------------------------
+
+# Keeps drug strengths, ICD codes and similar tokens intact: "500mg",
+# "j45.9", "b12", "covid-19".
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+to was were will with this these those which who if not no can may should
+""".split())
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_FILES = ("vocab.json", "offsets.npy", "docs.npy", "tfs.npy", "doc_ids.npy", "doc_lens.npy")
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunk store, in compressed sparse row form.
+
+    On disk, next to the FAISS index in the same generation (`<prefix>_bm25.`):
+      vocab.json    terms in term-ID order, plus corpus statistics
+      offsets.npy   int64, postings of term t are [offsets[t], offsets[t + 1])
+      docs.npy      int32 document positions, ascending within a term
+      tfs.npy       uint16 term frequencies, aligned with docs
+      doc_ids.npy   int64 chunk ID of each document position
+      doc_lens.npy  int32 token count of each document position
+
+    Arrays are memory-mapped like the chunk store; only the vocabulary is
+    read into memory. IDF is computed at query time from posting lengths.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+        with open(f"{prefix}_bm25.vocab.json", "r") as f:
+            meta = json.load(f)
+
+        self.terms = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        self.avg_doc_len = meta["avg_doc_len"]
+        self.k1 = meta.get("k1", BM25_K1)
+        self.b = meta.get("b", BM25_B)
+
+        self.offsets = np.load(f"{prefix}_bm25.offsets.npy", mmap_mode="r")
+        self.docs = np.load(f"{prefix}_bm25.docs.npy", mmap_mode="r")
+        self.tfs = np.load(f"{prefix}_bm25.tfs.npy", mmap_mode="r")
+        self.doc_ids = np.load(f"{prefix}_bm25.doc_ids.npy", mmap_mode="r")
+        self.doc_lens = np.load(f"{prefix}_bm25.doc_lens.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(prefix: str) -> bool:
+        return all(os.path.exists(f"{prefix}_bm25.{name}") for name in _FILES)
+
+    @staticmethod
+    def build(prefix: str, items, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Index (chunk id, text) pairs in one streaming pass. Postings are
+        accumulated in typed arrays and sorted into CSR form at the end, so
+        memory stays proportional to the number of postings.
+        """
+        terms = {}
+        posting_terms = array.array("i")
+        posting_docs = array.array("i")
+        posting_tfs = array.array("H")
+        doc_ids = array.array("q")
+        doc_lens = array.array("i")
+
+        for position, (chunk_id, text) in enumerate(items):
+            tokens = tokenize(text)
+            doc_ids.append(chunk_id)
+            doc_lens.append(len(tokens))
+
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+
+            for token, count in counts.items():
+                term_id = terms.setdefault(token, len(terms))
+                posting_terms.append(term_id)
+                posting_docs.append(position)
+                posting_tfs.append(min(count, 65535))
+
+        posting_terms = np.frombuffer(posting_terms, dtype=np.int32)
+        order = np.argsort(posting_terms, kind="stable")  # keeps docs ascending per term
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(terms)), out=offsets[1:])
+
+        lens = np.frombuffer(doc_lens, dtype=np.int32)
+        meta = {
+            "terms": sorted(terms, key=terms.get),
+            "avg_doc_len": float(lens.mean()) if len(lens) else 0.0,
+            "k1": k1,
+            "b": b,
+        }
+
+        arrays = {
+            "offsets.npy": offsets,
+            "docs.npy": np.frombuffer(posting_docs, dtype=np.int32)[order],
+            "tfs.npy": np.frombuffer(posting_tfs, dtype=np.uint16)[order],
+            "doc_ids.npy": np.frombuffer(doc_ids, dtype=np.int64),
+            "doc_lens.npy": lens,
+        }
+
+        for name, values in arrays.items():
+            with open(f"{prefix}_bm25.{name}", "wb") as f:
+                np.save(f, values)
+        with open(f"{prefix}_bm25.vocab.json", "w") as f:
+            json.dump(meta, f)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, top_k: int):
+        """
+        Return up to top_k (chunk id, score) pairs, best first.
+        """
+        term_ids = {self.terms[token] for token in tokenize(query) if token in self.terms}
+        if not term_ids or top_k <= 0:
+            return []
+
+        num_docs = len(self.doc_ids)
+        positions = []
+        weights = []
+
+        for term_id in term_ids:
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = np.asarray(self.docs[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+
+            df = end - start
+            idf = np.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[docs] / (self.avg_doc_len or 1.0))
+
+            positions.append(docs)
+            weights.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+
+        # Sum per document over the matched postings only, not the corpus.
+        candidates, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        return [(int(self.doc_ids[candidates[i]]), float(scores[i])) for i in best]
+
+
+def reciprocal_rank_fusion(rankings, weights, k: int = 60):
+    """
+    Fuse ranked ID lists: score(id) = sum of weight / (k + rank), rank from 1.
+    Returns IDs best first.
+    """
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+
+from app.agents import (
+    DISCLAIMER,
+    asking_for_facility,
+    discard_hospital_prefetch,
+    start_hospital_prefetch,
+    clarification_node,
+    hospital_node,
+    render_condition_section,
+    render_followup_section,
+    render_hospital_section,
+    render_medications_section,
+    render_next_steps_section,
+    render_precautions_section,
+    render_red_flags_section,
+    render_reply_section,
+    render_severity_section,
+    router_node,
+)
+from app.llm import (
+    abuild_messages,
+    cache_response,
+    aload_history,
+    alookup_cached_response,
+    astream_completion,
+    atry_fast_path,
+    discard_future,
+    parse_model_output,
+)
+from app.llm_scheduler import PRIORITY_NORMAL, guess_priority
+from app.persistence import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Incremental JSON Parsing
+# ---------------------------
+
+class IncrementalJSONParser:
+    """
+    Consumes a JSON object as it is being generated and returns each
+    top-level field as soon as its value is complete.
+
+    Only the top-level object is tracked: the parser counts brackets outside
+    of strings and, whenever a member ends (',' or the closing '}' at depth 1),
+    parses just that `"key": value` slice.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.done = False
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, text: str):
+        """
+        Append text; return a list of (key, value) pairs completed by it.
+        """
+
+        self.buffer += text
+        completed = []
+
+        while self._pos < len(self.buffer) and not self.done:
+            char = self.buffer[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+
+            elif char == '"':
+                self._in_string = True
+
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = self._pos + 1
+
+            elif char in "}]":
+                if self._depth == 1:
+                    completed += self._close_member()
+                    self.done = True
+                self._depth -= 1
+
+            elif char == "," and self._depth == 1:
+                completed += self._close_member()
+                self._member_start = self._pos + 1
+
+            self._pos += 1
+
+        return completed
+
+    def _close_member(self):
+        if self._member_start is None:
+            return []
+
+        member = self.buffer[self._member_start:self._pos].strip()
+        if not member:
+            return []
+
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return []
+
+        self.fields.update(parsed)
+        return list(parsed.items())
+
+
+# ---------------------------
+# Server-Sent Events
+# ---------------------------
+
+# (section, field that completes it, renderer), in final_node's order. A
+# section is sent once its field and every earlier section are complete, so
+# the stream is laid out like the /chat answer whatever order the model
+# writes the fields in. The reply section has no field to wait for: only
+# fast-path answers carry a "reply", the model's schema never does.
+SECTIONS = [
+    ("severity", "severity_level", render_severity_section),
+    ("reply", None, render_reply_section),
+    ("condition", "possible_conditions", render_condition_section),
+    ("next_steps", "next_steps", render_next_steps_section),
+    ("red_flags", "red_flags", render_red_flags_section),
+    ("medications", "possible_conditions", render_medications_section),
+    ("precautions", "precautions", render_precautions_section),
+]
+# Follows the hospital section, which needs the complete output.
+FOLLOW_UP_SECTION = ("follow_up", "follow_up_questions", render_followup_section)
+
+ERROR_MESSAGE = "I'm sorry, something went wrong while processing your request."
+
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def section_event(section: str, lines) -> str:
+    return sse_event("section", {"section": section, "text": "\n".join(lines)})
+
+
+def ready_sections(fields: dict, start: int, complete: bool = False):
+    """
+    Render SECTIONS[start:] up to the first one whose field has not arrived
+    (all of them once `complete`). Returns (events, index of the next section).
+    Sections without a field are rendered from whatever has arrived.
+    """
+    events = []
+    index = start
+    while index < len(SECTIONS):
+        section, field, render = SECTIONS[index]
+        if field is not None and field not in fields and not complete:
+            break
+        # Rendered from everything parsed so far, so sections that depend on
+        # severity_level see it.
+        lines = render(fields)
+        if lines:
+            events.append(section_event(section, lines))
+        index += 1
+    return events, index
+
+
+async def stream_chat(state: dict):
+    """
+    Streaming counterpart of medical_graph.
+
+    Emits one `section` event per rendered section, in final_node's order,
+    while the model is still generating, then runs the router (hospital
+    lookup / clarification) on the complete output, sends the follow-up
+    questions and finishes with a `done` event.
+    """
+
+    recent_messages, summary = await aload_history(state["session_id"], state.get("session_context"))
+    priority = guess_priority(state["message"], recent_messages)
+
+    cached, cache_vector = None, None
+
+    # Possibly urgent messages always go to the model, as in intent_node.
+    if priority == PRIORITY_NORMAL and not asking_for_facility(state["message"]):
+        cached = await atry_fast_path(state.get("intent_classifier"), state["message"], recent_messages)
+
+    if cached is None:
+        cached, cache_vector = await alookup_cached_response(
+            state["message"], recent_messages, summary, state["rag"]
+        )
+
+    if cached is not None:
+        # Fast-path or cached response: render every section at once.
+        discard_future(state.get("retrieval"))
+        parsed = cached
+        for event in ready_sections(parsed, 0, complete=True)[0]:
+            yield event
+
+    else:
+        start_hospital_prefetch(state)
+
+        messages = await abuild_messages(
+            state["message"], recent_messages, summary, state["rag"], state.get("retrieval")
+        )
+
+        parser = IncrementalJSONParser()
+        next_section = 0
+
+        try:
+            async for delta in astream_completion(messages, priority=priority):
+                if not parser.feed(delta):
+                    continue
+                events, next_section = ready_sections(parser.fields, next_section)
+                for event in events:
+                    yield event
+
+        except asyncio.TimeoutError:
+            logger.error("LLM stream timed out")
+            discard_hospital_prefetch(state)
+            yield sse_event("error", {"text": ERROR_MESSAGE})
+            return
+
+        except Exception as e:
+            logger.error("LLM stream failed", extra={"error": str(e)})
+            discard_hospital_prefetch(state)
+            yield sse_event("error", {"text": ERROR_MESSAGE})
+            return
+
+        parsed = parse_model_output(parser.buffer)
+
+        cache_response(cache_vector, parsed)
+
+        # Sections whose field the model left out, and any after them.
+        if "error" not in parsed:
+            for event in ready_sections(parser.fields, next_section, complete=True)[0]:
+                yield event
+
+    write_queue.save_turn(state["session_id"], state["message"], parsed)
+
+    if "error" in parsed:
+        discard_hospital_prefetch(state)
+        yield sse_event("error", {"text": ERROR_MESSAGE})
+        return
+
+    state["llm_output"] = parsed
+    route = router_node(state)
+
+    if route != "hospital_node":
+        discard_hospital_prefetch(state)
+
+    if route == "clarification_node":
+        clarification_node(state)
+        yield sse_event("section", {"section": "clarification", "text": state["final_output"]})
+
+    elif route == "hospital_node":
+        await hospital_node(state)
+        lines = render_hospital_section(parsed, state.get("hospital_info"))
+        if lines:
+            yield section_event("hospital", lines)
+
+    section, _, render = FOLLOW_UP_SECTION
+    lines = render(parsed)
+    if lines:
+        yield section_event(section, lines)
+
+    yield sse_event("done", {"text": DISCLAIMER.strip()})
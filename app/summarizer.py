@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+from app.llm import arefresh_summary
+from app.persistence import write_queue
+from app.telemetry import ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Background Summary Worker
+# ---------------------------
+
+class SummaryWorker:
+    """
+    Refreshes rolling conversation summaries off the request path.
+
+    Endpoints enqueue a session once its response has been sent; a single
+    background task folds the new messages into the stored summary. A session
+    that is already waiting in the queue is not queued twice.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._pending = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, session_id: str):
+        # Async so Starlette background tasks call it on the event loop
+        # rather than in a worker thread.
+        if self._task is None or session_id in self._pending:
+            return
+        self._pending.add(session_id)
+        self._queue.put_nowait(session_id)
+
+    async def _run(self):
+        while True:
+            session_id = await self._queue.get()
+            self._pending.discard(session_id)
+            try:
+                # The turn that triggered this may still be in the write queue.
+                await write_queue.await_session(session_id)
+                await arefresh_summary(session_id)
+            except Exception as e:
+                ERRORS.inc("summary_refresh")
+                logger.warning("Summary refresh failed", extra={"session_id": session_id, "error": str(e)})
+            finally:
+                self._queue.task_done()
+
+    async def close(self, timeout: float = 10.0):
+        if self._task is None:
+            return
+
+        # Give queued sessions a chance to finish before shutting down.
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Summary worker stopped with sessions pending", extra={"pending": self._queue.qsize()})
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
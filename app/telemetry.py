@@ -0,0 +1,430 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# ---------------------------
+# Prometheus Metrics
+# ---------------------------
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers sub-millisecond index lookups up to slow LLM calls.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    A metric family in the Prometheus text format. Label values are passed
+    positionally, in the order of `labels`.
+    """
+
+    type = None
+
+    def __init__(self, name: str, help_text: str, labels=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labels, key)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, *label_values):
+        """
+        Mirror a running total that another object already counts.
+        """
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels, registry)
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        # Per-bucket counts; cumulated when rendered.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return "\n".join(lines)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = Histogram(
+    "medigrated_http_request_duration_seconds",
+    "HTTP request latency, including the streamed body.",
+    ("method", "path", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "medigrated_http_requests_in_flight",
+    "HTTP requests currently being served.",
+)
+NODE_DURATION = Histogram(
+    "medigrated_node_duration_seconds",
+    "Time spent in each chat pipeline node.",
+    ("node",),
+)
+STAGE_DURATION = Histogram(
+    "medigrated_stage_duration_seconds",
+    "Time spent in pipeline sub-steps (DB, retrieval, LLM, ...).",
+    ("stage",),
+)
+ERRORS = Counter(
+    "medigrated_errors_total",
+    "Failures by node or stage; 'http' counts 5xx responses.",
+    ("stage",),
+)
+LLM_REQUESTS_IN_FLIGHT = Gauge(
+    "medigrated_llm_requests_in_flight",
+    "Groq requests holding a concurrency slot.",
+)
+BATCH_SIZE = Histogram(
+    "medigrated_batch_size",
+    "Items per micro-batch.",
+    ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+PROMPT_TOKENS = Histogram(
+    "medigrated_prompt_tokens",
+    "Estimated input tokens per packed prompt.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+PROMPT_SECTION_TOKENS = Counter(
+    "medigrated_prompt_section_tokens_total",
+    "Prompt tokens by section (instructions, summary, evidence, history, user).",
+    ("section",),
+)
+PROMPT_TRIMMED = Counter(
+    "medigrated_prompt_trimmed_total",
+    "Evidence chunks and history messages left out of prompts, by reason.",
+    ("reason",),
+)
+PROMPT_OVER_BUDGET = Counter(
+    "medigrated_prompt_over_budget_total",
+    "Prompts larger than the token budget (instructions and message alone exceed it).",
+)
+WRITE_QUEUE_DEPTH = Gauge(
+    "medigrated_write_queue_depth",
+    "Writes waiting for the write-behind writer (sampled on scrape).",
+)
+
+# Mirrors of counters kept by the caches, the intent classifier and the
+# history compactor; refreshed on scrape by refresh_component_metrics().
+CACHE_LOOKUPS = Counter(
+    "medigrated_cache_lookups_total",
+    "Cache lookups by cache and result (hit, miss, bypass).",
+    ("cache", "result"),
+)
+CACHE_ENTRIES = Gauge(
+    "medigrated_cache_entries",
+    "Entries currently held by each cache.",
+    ("cache",),
+)
+CACHE_EVICTIONS = Counter(
+    "medigrated_cache_evictions_total",
+    "Entries evicted from each cache.",
+    ("cache",),
+)
+INTENT_CHECKS = Counter(
+    "medigrated_intent_checks_total",
+    "Messages checked by the intent fast path.",
+)
+INTENT_FAST_PATH = Counter(
+    "medigrated_intent_fast_path_total",
+    "Messages answered by the intent fast path, by intent.",
+    ("intent",),
+)
+HISTORY_COMPACTION_RUNS = Counter(
+    "medigrated_history_compaction_runs_total",
+    "History compaction runs.",
+)
+HISTORY_ARCHIVED = Counter(
+    "medigrated_history_archived_total",
+    "Sessions and messages moved to the history archive.",
+    ("kind",),
+)
+HISTORY_FREED_BYTES = Counter(
+    "medigrated_history_freed_bytes_total",
+    "Bytes returned to the OS by history compaction.",
+)
+
+
+def refresh_component_metrics(response_cache=None, embedding_cache=None, intent_classifier=None, compactor=None):
+    """
+    Copy the stats() of components that keep their own counters into the
+    registry. Components that are disabled (None) are skipped.
+    """
+    if response_cache is not None:
+        stats = response_cache.stats()
+        for result, key in (("hit", "hits"), ("miss", "misses"), ("bypass", "bypasses")):
+            CACHE_LOOKUPS.set_total(stats[key], "response", result)
+        CACHE_ENTRIES.set(stats["size"], "response")
+        CACHE_EVICTIONS.set_total(stats["evictions"], "response")
+
+    if embedding_cache is not None:
+        stats = embedding_cache.stats()
+        CACHE_LOOKUPS.set_total(stats["hits"], "embedding", "hit")
+        CACHE_LOOKUPS.set_total(stats["misses"], "embedding", "miss")
+        CACHE_ENTRIES.set(stats["size"], "embedding")
+
+    if intent_classifier is not None:
+        stats = intent_classifier.stats()
+        INTENT_CHECKS.set_total(stats["checked"])
+        for intent, count in stats["fired_by_intent"].items():
+            INTENT_FAST_PATH.set_total(count, intent)
+
+    if compactor is not None:
+        stats = compactor.stats()
+        HISTORY_COMPACTION_RUNS.set_total(stats["runs"])
+        HISTORY_ARCHIVED.set_total(stats["sessions_archived"], "sessions")
+        HISTORY_ARCHIVED.set_total(stats["messages_archived"], "messages")
+        HISTORY_FREED_BYTES.set_total(stats["freed_bytes"])
+
+
+# ---------------------------
+# Structured Logging
+# ---------------------------
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def _extra_fields(record) -> dict:
+    fields = {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+    if request_id.get() is not None:
+        fields.setdefault("request_id", request_id.get())
+    return fields
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, the
+    current request ID and any fields passed with `extra=`.
+    """
+
+    def format(self, record) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable lines with the structured fields appended as key=value.
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json"):
+    """
+    Send the `app.*` loggers to stderr. Uvicorn's own loggers are untouched.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Timing Spans
+# ---------------------------
+
+@contextmanager
+def span(name: str, histogram: Histogram = STAGE_DURATION):
+    """
+    Time a block into `histogram` (labelled `name`) and log it at DEBUG.
+    An exception escaping the block is counted in ERRORS and re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, name)
+        logger.debug("span", extra={"span": name, "duration_ms": round(elapsed * 1000, 2)})
+
+
+def traced_node(name: str):
+    """
+    Decorator timing a graph node (sync or async) into NODE_DURATION.
+    """
+
+    def decorate(node):
+        if asyncio.iscoroutinefunction(node):
+            @functools.wraps(node)
+            async def run(state):
+                with span(name, NODE_DURATION):
+                    return await node(state)
+        else:
+            @functools.wraps(node)
+            def run(state):
+                with span(name, NODE_DURATION):
+                    return node(state)
+        return run
+
+    return decorate
+
+
+# ---------------------------
+# Request Middleware
+# ---------------------------
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request latency (until the last body chunk is sent,
+    so streamed responses are timed in full), in-flight requests, 5xx
+    counts, and a request ID for log lines. Paths are labelled by route
+    template; unknown paths share the label "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        token = request_id.set(headers.get(b"x-request-id", b"").decode() or uuid.uuid4().hex[:16])
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope.
+            path = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], path, status)
+            if status >= 500:
+                ERRORS.inc("http")
+            request_id.reset(token)
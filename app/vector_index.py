@@ -0,0 +1,264 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+
+# ---------------------------
+# FAISS Index Types
+# ---------------------------
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 1024,          # IVF / IVF-PQ: number of coarse clusters
+    "nprobe": 16,           # IVF / IVF-PQ: clusters visited per query
+    "hnsw_m": 32,           # HNSW: neighbours per node
+    "ef_construction": 200, # HNSW: build-time beam width
+    "ef_search": 64,        # HNSW: query-time beam width
+    "pq_m": 16,             # IVF-PQ: sub-quantizers (must divide the dimension)
+    "pq_bits": 8,           # IVF-PQ: bits per sub-quantizer code
+    "train_size": 100000,   # max vectors sampled for IVF training
+}
+
+# Parameters that only affect search and can be changed on a built index.
+SEARCH_PARAMS = ("nprobe", "ef_search")
+
+_ENV_PARAMS = {
+    "nlist": "INDEX_NLIST",
+    "nprobe": "INDEX_NPROBE",
+    "hnsw_m": "INDEX_HNSW_M",
+    "ef_construction": "INDEX_EF_CONSTRUCTION",
+    "ef_search": "INDEX_EF_SEARCH",
+    "pq_m": "INDEX_PQ_M",
+    "pq_bits": "INDEX_PQ_BITS",
+    "train_size": "INDEX_TRAIN_SIZE",
+}
+
+
+def env_index_type() -> str:
+    return os.getenv("INDEX_TYPE", "flat").lower()
+
+
+def env_index_params() -> dict:
+    """
+    Index parameters explicitly set in the environment (unset ones omitted,
+    so they don't override values saved with an existing index).
+    """
+    params = {}
+    for key, env_name in _ENV_PARAMS.items():
+        value = os.getenv(env_name)
+        if value is not None:
+            params[key] = int(value)
+    return params
+
+
+def make_index(index_type: str, dimension: int, params: dict, num_vectors: int):
+    """
+    Create an empty inner-product index of the given type.
+    `num_vectors` is used to keep the IVF cluster count trainable.
+    """
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dimension)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+
+    # FAISS wants ~39 training points per cluster.
+    nlist = max(1, min(params["nlist"], num_vectors // 39))
+    quantizer = faiss.IndexFlatIP(dimension)
+
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+
+    if dimension % params["pq_m"] != 0:
+        raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}")
+    if num_vectors < 2 ** params["pq_bits"]:
+        raise ValueError(
+            f"IVF-PQ with pq_bits={params['pq_bits']} needs at least "
+            f"{2 ** params['pq_bits']} vectors to train, got {num_vectors}"
+        )
+
+    return faiss.IndexIVFPQ(
+        quantizer, dimension, nlist, params["pq_m"], params["pq_bits"],
+        faiss.METRIC_INNER_PRODUCT
+    )
+
+
+def train_index(index, embeddings, params: dict):
+    if index.is_trained:
+        return
+
+    sample = embeddings
+    if len(sample) > params["train_size"]:
+        rng = np.random.default_rng(0)
+        sample = sample[rng.choice(len(sample), params["train_size"], replace=False)]
+
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+
+
+def apply_search_params(index, params: dict):
+    """
+    Apply query-time knobs (nprobe / efSearch); ignored for index types
+    that don't have them.
+    """
+    space = faiss.ParameterSpace()
+
+    for key, faiss_name in (("nprobe", "nprobe"), ("ef_search", "efSearch")):
+        if key not in params:
+            continue
+        try:
+            space.set_index_parameter(index, faiss_name, params[key])
+        except RuntimeError:
+            pass
+
+
+def build_index(embeddings, index_type: str, params: dict, ids=None):
+    """
+    Build and fill an index. With `ids`, vectors are stored under those IDs
+    so they can later be removed by ID.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+
+    index = make_index(index_type, embeddings.shape[1], params, len(embeddings))
+    train_index(index, embeddings, params)
+
+    if ids is None:
+        index.add(embeddings)
+    elif index_type in ("ivf", "ivfpq"):
+        # IVF lists store external IDs natively. IndexIDMap must not wrap
+        # them: its remove_ids assumes the inner index renumbers on removal.
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+    else:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+
+    apply_search_params(index, params)
+
+    return index
+
+
+class IndexWriter:
+    """
+    Adds batches of (embeddings, ids) to an index as they are produced.
+
+    If there is no index yet, one is created on the first batch; IVF types
+    first buffer up to `train_size` vectors so training sees a real sample.
+    """
+
+    def __init__(self, index, index_type: str, params: dict):
+        self.index = index
+        self.index_type = index_type
+        self.params = params
+        self._pending = []
+        self._pending_count = 0
+
+    def add(self, embeddings, ids):
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+
+        if self.index is not None:
+            self.index.add_with_ids(embeddings, ids)
+            return
+
+        self._pending.append((embeddings, ids))
+        self._pending_count += len(ids)
+
+        needs_training = self.index_type in ("ivf", "ivfpq")
+        if not needs_training or self._pending_count >= self.params["train_size"]:
+            self._build_from_pending()
+
+    def _build_from_pending(self):
+        embeddings = np.concatenate([e for e, _ in self._pending])
+        ids = np.concatenate([i for _, i in self._pending])
+        self._pending = []
+        self._pending_count = 0
+
+        self.index = build_index(embeddings, self.index_type, self.params, ids=ids)
+
+    def finish(self):
+        if self._pending:
+            self._build_from_pending()
+        return self.index
+
+
+def remove_ids(index, ids, index_type: str, params: dict):
+    """
+    Remove vectors from an ID-mapped index and return the resulting index.
+
+    Index types without native removal (HNSW behind IndexIDMap2) are rebuilt
+    from their stored vectors, which avoids re-embedding anything.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return index
+
+    try:
+        index.remove_ids(ids)
+        return index
+    except RuntimeError:
+        pass
+
+    all_ids, vectors = index_vectors(index)
+    keep = ~np.isin(all_ids, ids)
+
+    if not keep.any():
+        return None
+
+    return build_index(vectors[keep], index_type, params, ids=all_ids[keep])
+
+
+def index_vectors(index):
+    """
+    Return (ids, vectors) stored in an index built by build_index.
+    IVF-PQ vectors come back PQ-decoded, i.e. approximate.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        return faiss.vector_to_array(index.id_map), inner.reconstruct_n(0, inner.ntotal)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        invlists = ivf.invlists
+        ids = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(ivf.nlist)
+            if invlists.list_size(list_no)
+        ]
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+
+        # Arbitrary external IDs need the hashtable direct map.
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return ids, index.reconstruct_batch(ids)
+
+    return np.arange(index.ntotal, dtype="int64"), index.reconstruct_n(0, index.ntotal)
+
+
+# ---------------------------
+# Index Metadata
+# ---------------------------
+
+def save_index_meta(path: str, index_type: str, params: dict):
+    with open(path, "w") as f:
+        json.dump({"index_type": index_type, "params": params}, f, indent=2)
+
+
+def load_index_meta(path: str):
+    """
+    Return (index_type, params) saved next to an index, or ("flat", {})
+    for indexes built before the metadata file existed.
+    """
+    if not os.path.exists(path):
+        return "flat", {}
+
+    with open(path, "r") as f:
+        meta = json.load(f)
+
+    return meta.get("index_type", "flat"), meta.get("params", {})
@@ -0,0 +1,459 @@
+# benchmark_chat.py
+#
+# Offline load test and micro-benchmarks. The Groq client is replaced by a
+# local stub (configurable latency, canned JSON) and the MCP server runs
+# in-process, so results measure this service only and cost nothing.
+#
+#   python benchmark_chat.py e2e --requests 500 --concurrency 32
+#   python benchmark_chat.py e2e --stream --llm-latency 1200 --llm-jitter 300
+#   python benchmark_chat.py micro
+#   python benchmark_chat.py micro --skip-build
+#
+# Conversations are written to a temporary SQLite database, never to
+# chat_history.db; the index benchmark builds into a temporary directory.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+# Must be set before app modules are imported.
+WORK_DIR = tempfile.mkdtemp(prefix="medigrated-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ.setdefault("GROQ_API_KEY", "benchmark-stub")
+
+
+SYMPTOM_MESSAGES = [
+    "I have a headache and fever since yesterday",
+    "fever and body ache for three days",
+    "persistent dry cough at night",
+    "burning sensation while urinating",
+    "stomach pain after eating and vomiting",
+    "dizziness and blurred vision",
+    "rash on arms with itching",
+    "high blood sugar and frequent thirst",
+    "what is the dose of paracetamol for fever",
+]
+HOSPITAL_MESSAGES = [
+    "severe chest pain radiating to my left arm, which hospital in Hyderabad?",
+    "I can't breathe properly, nearest hospital in Mumbai please",
+    "my child has a high fever and seizure, hospital in Bangalore",
+]
+SMALL_TALK_MESSAGES = ["hi", "hello doctor", "thanks", "ok thanks", "bye"]
+
+# Share of each kind of message in the e2e mix.
+MESSAGE_MIX = [(SYMPTOM_MESSAGES, 0.6), (HOSPITAL_MESSAGES, 0.2), (SMALL_TALK_MESSAGES, 0.2)]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def print_latency(label, seconds):
+    ms = np.asarray(seconds) * 1000
+    print(
+        f"{label:<28} n={len(ms):<6} p50={percentile(ms, 50):>8.2f} "
+        f"p95={percentile(ms, 95):>8.2f} p99={percentile(ms, 99):>8.2f} ms"
+    )
+
+
+# ---------------------------
+# Groq Stub
+# ---------------------------
+
+def canned_response(user_message: str) -> dict:
+    text = user_message.lower()
+    emergency = any(word in text for word in ("chest pain", "breathe", "seizure"))
+
+    return {
+        "severity_level": "emergency" if emergency else "moderate",
+        "possible_conditions": [
+            {
+                "name": "Acute coronary syndrome" if emergency else "Viral infection",
+                "likelihood": "high",
+                "reason": "The reported symptoms and their duration are typical of this condition.",
+                "recommended_action": "Seek care" if emergency else "Rest and hydrate",
+                "possible_medications": [] if emergency else ["paracetamol"],
+            }
+        ],
+        "precautions": ["Avoid exertion"],
+        "next_steps": ["Monitor symptoms"],
+        "recommended_specialists": ["Cardiology"] if emergency else [],
+        "red_flags": ["Difficulty breathing"],
+        "follow_up_questions": [] if emergency else ["How long have you had these symptoms?"],
+        "disclaimer": "Educational only. Not medical advice.",
+    }
+
+
+class StubCompletions:
+    """
+    Stands in for `chat.completions` of Groq / AsyncGroq. Each call sleeps
+    latency ± jitter; streamed calls deliver the first chunk after
+    `first_token` of that time and spread the rest over the chunks.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float, first_token: float = 0.3, chunk_chars: int = 24):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.first_token = first_token
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, random.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)) / 1000
+
+    def _content(self, messages) -> str:
+        if "rolling summary" in messages[0]["content"]:
+            return "Patient reported fever, headache and body ache over several days."
+        return json.dumps(canned_response(messages[-1]["content"]))
+
+    async def create(self, messages, stream: bool = False, **kwargs):
+        self.calls += 1
+        content = self._content(messages)
+        delay = self._delay()
+
+        if stream:
+            return self._stream(content, delay)
+
+        await asyncio.sleep(delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def _stream(self, content: str, delay: float):
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        gap = delay * (1 - self.first_token) / max(len(pieces) - 1, 1)
+
+        await asyncio.sleep(delay * self.first_token)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(gap)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+def install_llm_stub(latency_ms: float, jitter_ms: float) -> StubCompletions:
+    import app.llm as llm
+
+    completions = StubCompletions(latency_ms, jitter_ms)
+    llm.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+
+# ---------------------------
+# In-Process MCP Server
+# ---------------------------
+
+class InProcessMCPPool:
+    """
+    Drop-in for MCPSessionPool that calls the FastMCP server object
+    directly: same tools and argument validation, no subprocess or stdio.
+    """
+
+    latency_ms = 0.0
+
+    def __init__(self, server_script_path: str, **kwargs):
+        sys.path.insert(0, os.path.dirname(os.path.abspath(server_script_path)))
+        import server
+
+        self.server = server.mcp
+        self.calls = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def call_tool(self, tool_name: str, arguments: dict):
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        result = await self.server.call_tool(tool_name, arguments)
+        if isinstance(result, tuple):  # newer FastMCP: (content, structured)
+            result = result[0]
+        return SimpleNamespace(content=list(result))
+
+
+# ---------------------------
+# End-to-End Load Test
+# ---------------------------
+
+def build_workload(count: int, sessions: int, seed: int = 0):
+    rng = random.Random(seed)
+    pools, weights = zip(*MESSAGE_MIX)
+
+    workload = []
+    for i in range(count):
+        message = rng.choice(rng.choices(pools, weights)[0])
+        workload.append({"session_id": f"bench-{i % sessions}", "message": message})
+    return workload
+
+
+async def send(client, path: str, payload: dict, stream: bool):
+    # httpx's ASGI transport hands over the body once the app has finished,
+    # so for /chat/stream this is total time, not time to first token.
+    start = time.perf_counter()
+
+    if not stream:
+        response = await client.post(path, json=payload)
+        response.raise_for_status()
+    else:
+        async with client.stream("POST", path, json=payload) as response:
+            response.raise_for_status()
+            async for _ in response.aiter_bytes():
+                pass
+
+    return time.perf_counter() - start
+
+
+async def drive(client, workload, concurrency: int, stream: bool):
+    path = "/chat/stream" if stream else "/chat"
+    latencies, errors = [], []
+    queue = iter(workload)
+
+    async def worker():
+        for payload in queue:
+            try:
+                latencies.append(await send(client, path, payload, stream))
+            except Exception as e:
+                errors.append(repr(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, errors
+
+
+async def run_e2e(args):
+    import httpx
+
+    import app.main as main
+
+    import app.llm as llm
+
+    completions = install_llm_stub(args.llm_latency, args.llm_jitter)
+    if not args.provider_limits:
+        llm.llm_scheduler.limits = {}  # the stub has no rate limits
+    InProcessMCPPool.latency_ms = args.mcp_latency
+    main.MCPSessionPool = InProcessMCPPool
+
+    print("Starting app (loads the RAG index)...")
+    await main.startup_event()
+
+    # The in-process MCP server turns on INFO logging; keep per-request lines out.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            if args.warmup:
+                await drive(client, build_workload(args.warmup, args.sessions, seed=1), args.concurrency, args.stream)
+
+            llm_calls, mcp_calls = completions.calls, main.mcp_pool.calls
+            workload = build_workload(args.requests, args.sessions, args.seed)
+            elapsed, latencies, errors = await drive(client, workload, args.concurrency, args.stream)
+    finally:
+        await main.shutdown_event()
+
+    print()
+    print(
+        f"endpoint={'/chat/stream' if args.stream else '/chat'} requests={args.requests} "
+        f"concurrency={args.concurrency} sessions={args.sessions} "
+        f"llm={args.llm_latency:.0f}±{args.llm_jitter:.0f}ms mcp={args.mcp_latency:.0f}ms"
+    )
+    print(f"ok={len(latencies)} errors={len(errors)} wall={elapsed:.2f}s rps={len(latencies) / elapsed:.1f}")
+    print_latency("latency", latencies)
+    print(f"llm calls={completions.calls - llm_calls} mcp calls={main.mcp_pool.calls - mcp_calls}")
+
+    print("llm scheduler:", llm.llm_scheduler.stats())
+    if main.intent_classifier is not None:
+        print("intent:", main.intent_classifier.stats())
+    print("persistence:", main.write_queue.stats())
+    for error in sorted(set(errors))[:5]:
+        print("error:", error)
+
+
+# ---------------------------
+# Micro-Benchmarks
+# ---------------------------
+
+def time_calls(fn, items, repeats: int = 1):
+    timings = []
+    for _ in range(repeats):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_retrieve(rag, args):
+    from app.rag import EmbeddingCache
+
+    queries = SYMPTOM_MESSAGES + HOSPITAL_MESSAGES
+    configured = rag.retrieval_mode
+
+    for mode in ("dense", "sparse", "hybrid"):
+        rag.retrieval_mode = mode
+        rag.query_cache = EmbeddingCache()
+        cold = time_calls(lambda q: rag.retrieve(q, args.k), queries)
+        warm = time_calls(lambda q: rag.retrieve(q, args.k), queries, args.repeats)
+        print_latency(f"retrieve {mode} (cold)", cold)
+        print_latency(f"retrieve {mode} (warm)", warm)
+
+    rag.retrieval_mode = configured
+
+
+def bench_retrieve_concurrent(rag, args):
+    # Distinct queries from many threads at once, so every query is encoded:
+    # one encode per call without the micro-batcher, shared batches with it.
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.rag import EmbeddingCache
+
+    queries = [f"{message} (variant {i})" for i in range(args.concurrent_queries // len(SYMPTOM_MESSAGES) + 1) for message in SYMPTOM_MESSAGES]
+    queries = queries[:args.concurrent_queries]
+    batcher = rag.batcher
+
+    for label, active in (("unbatched", None), ("micro-batched", batcher)):
+        if label == "micro-batched" and batcher is None:
+            print("micro-batching disabled (EMBED_BATCH_SIZE=1)")
+            break
+        rag.batcher = active
+        rag.query_cache = EmbeddingCache()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            timings = list(pool.map(lambda q: time_calls(lambda item: rag.retrieve(item, args.k), [q])[0], queries))
+        elapsed = time.perf_counter() - start
+
+        print_latency(f"retrieve x{args.threads} {label}", timings)
+        print(f"{'':<28} {len(queries) / elapsed:.0f} queries/s")
+
+    rag.batcher = batcher
+    if batcher is not None:
+        print("batcher:", batcher.stats())
+
+
+def bench_create_index(args):
+    import app.rag as rag_module
+    from app.rag import MedicalRAG
+
+    saved = rag_module.INDEX_PATH
+    rag_module.INDEX_PATH = os.path.join(WORK_DIR, "faiss_index")
+    try:
+        rag = MedicalRAG()
+
+        start = time.perf_counter()
+        rag.create_index(force=True)
+        print(f"{'create_index (full)':<28} {time.perf_counter() - start:>8.2f} s  chunks={len(rag.documents)}")
+
+        start = time.perf_counter()
+        rag.create_index()
+        print(f"{'create_index (no changes)':<28} {time.perf_counter() - start:>8.2f} s")
+    finally:
+        rag_module.INDEX_PATH = saved
+
+
+def bench_history(args):
+    from datetime import datetime, timedelta
+
+    from app.config import SUMMARY_KEEP_RECENT, SUMMARY_TRIGGER_MESSAGES
+    from app.database import init_db, load_session_context, write_batch
+    from app.persistence import WriteBehindQueue
+
+    init_db()
+
+    base = datetime.utcnow()
+    rows = [
+        {
+            "session_id": f"hist-{s}",
+            "role": "user" if m % 2 == 0 else "assistant",
+            "message": json.dumps(canned_response("fever")) if m % 2 else "fever and body ache",
+            "timestamp": base + timedelta(seconds=m),
+        }
+        for s in range(args.sessions)
+        for m in range(args.history)
+    ]
+    start = time.perf_counter()
+    write_batch(rows, {f"hist-{s}": "Hyderabad" for s in range(args.sessions)})
+    print(f"{'seed history':<28} {len(rows)} rows in {time.perf_counter() - start:.2f} s")
+
+    session_ids = [f"hist-{s}" for s in range(args.sessions)]
+    timings = time_calls(lambda sid: load_session_context(sid, SUMMARY_TRIGGER_MESSAGES, SUMMARY_KEEP_RECENT), session_ids, args.repeats)
+    print_latency("load_session_context", timings)
+
+    turn = rows[:2]
+    timings = time_calls(lambda _: write_batch([dict(row) for row in turn], {}), range(args.turns))
+    print_latency("write_batch (1 turn, sync)", timings)
+
+    queue = WriteBehindQueue()
+    queue.start()
+    start = time.perf_counter()
+    for i in range(args.turns):
+        queue.save_turn(f"hist-{i % args.sessions}", "fever", canned_response("fever"))
+    queue.close(timeout=60)
+    elapsed = time.perf_counter() - start
+    print(f"{'write-behind queue':<28} {args.turns} turns in {elapsed:.2f} s ({args.turns / elapsed:.0f} turns/s)")
+
+
+def run_micro(args):
+    from app.rag import MedicalRAG
+
+    bench_history(args)
+
+    rag = MedicalRAG()
+    rag.initialize()
+    bench_retrieve(rag, args)
+    bench_retrieve_concurrent(rag, args)
+
+    if not args.skip_build:
+        bench_create_index(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test and micro-benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    e2e = commands.add_parser("e2e", help="drive the FastAPI app with stubbed LLM and MCP server")
+    e2e.add_argument("--requests", type=int, default=200)
+    e2e.add_argument("--concurrency", type=int, default=16)
+    e2e.add_argument("--sessions", type=int, default=50, help="distinct session IDs the requests rotate over")
+    e2e.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    e2e.add_argument("--stream", action="store_true", help="use /chat/stream instead of /chat")
+    e2e.add_argument("--llm-latency", type=float, default=800, help="stub completion latency in ms")
+    e2e.add_argument("--llm-jitter", type=float, default=200, help="± uniform jitter in ms")
+    e2e.add_argument("--mcp-latency", type=float, default=5, help="added per tool call in ms")
+    e2e.add_argument("--provider-limits", action="store_true", help="apply LLM_RPM/LLM_TPM limits to the stub")
+    e2e.add_argument("--seed", type=int, default=0)
+
+    micro = commands.add_parser("micro", help="retrieve, create_index and DB history path")
+    micro.add_argument("--k", type=int, default=3)
+    micro.add_argument("--repeats", type=int, default=5)
+    micro.add_argument("--threads", type=int, default=16, help="concurrent callers for the batching benchmark")
+    micro.add_argument("--concurrent-queries", type=int, default=256)
+    micro.add_argument("--sessions", type=int, default=200)
+    micro.add_argument("--history", type=int, default=40, help="messages seeded per session")
+    micro.add_argument("--turns", type=int, default=500, help="turns written by the write benchmarks")
+    micro.add_argument("--skip-build", action="store_true", help="skip the create_index benchmark")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "e2e":
+            asyncio.run(run_e2e(args))
+        else:
+            run_micro(args)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
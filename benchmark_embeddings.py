@@ -0,0 +1,117 @@
+# benchmark_embeddings.py
+#
+# Compare embedding backends on CPU: single-query latency, cosine agreement
+# with the fp32 model, and overlap of retrieved chunks against the built index.
+#
+#   python benchmark_embeddings.py
+#   python benchmark_embeddings.py --threads 1 2 4 --k 3
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.chunk_store import current_prefix
+from app.embeddings import EMBEDDING_BACKENDS, load_embedding_model, set_embedding_threads
+from app.rag import EMBEDDING_MODEL_NAME, INDEX_PATH, read_faiss_index
+from app.vector_index import apply_search_params, load_index_meta
+
+
+SAMPLE_QUERIES = [
+    "I have a headache and fever",
+    "fever and body ache for three days",
+    "chest pain radiating to left arm",
+    "shortness of breath when climbing stairs",
+    "persistent dry cough at night",
+    "burning sensation while urinating",
+    "stomach pain after eating and vomiting",
+    "dizziness and blurred vision",
+    "rash on arms with itching",
+    "high blood sugar and frequent thirst",
+    "joint pain and swelling in knees",
+    "sore throat and difficulty swallowing",
+    "what is the dose of paracetamol for adults",
+    "child has diarrhoea and is not drinking",
+    "hi",
+    "I'm fine",
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q))
+
+
+def measure_latency(model, queries, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            model.encode([query], normalize_embeddings=True)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def load_index():
+    prefix = current_prefix(INDEX_PATH)
+    if not os.path.exists(f"{prefix}.index"):
+        return None
+
+    index_type, params = load_index_meta(f"{prefix}_meta.json")
+    index = read_faiss_index(f"{prefix}.index", index_type, mmap=False)
+    apply_search_params(index, params)
+    return index
+
+
+def overlap_at_k(reference_ids, ids, k: int) -> float:
+    hits = sum(
+        len(set(r[:k]) & set(i[:k]))
+        for r, i in zip(reference_ids, ids)
+    )
+    return hits / (len(reference_ids) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends on CPU.")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS))
+    parser.add_argument("--threads", nargs="+", type=int, default=[0], help="torch intra-op threads (0 = default)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    queries = SAMPLE_QUERIES
+    index = load_index()
+
+    models = {
+        backend: load_embedding_model(EMBEDDING_MODEL_NAME, backend=backend, warmup=True)
+        for backend in ["fp32"] + [b for b in args.backends if b != "fp32"]
+    }
+
+    reference = models["fp32"].encode(queries, normalize_embeddings=True)
+    reference_ids = index.search(reference, args.k)[1] if index is not None else None
+
+    print(f"model={EMBEDDING_MODEL_NAME} queries={len(queries)} repeats={args.repeats}")
+    print(f"{'backend':<8} {'threads':>7} {'p50 ms':>8} {'p95 ms':>8} {'cos mean':>9} {'cos min':>8} {f'overlap@{args.k}':>10}")
+
+    for backend in args.backends:
+        model = models[backend]
+
+        embeddings = model.encode(queries, normalize_embeddings=True)
+        cosine = np.sum(embeddings * reference, axis=1)
+
+        overlap = "-"
+        if index is not None:
+            ids = index.search(np.ascontiguousarray(embeddings, dtype="float32"), args.k)[1]
+            overlap = f"{overlap_at_k(reference_ids, ids, args.k):.3f}"
+
+        for threads in args.threads:
+            set_embedding_threads(threads)
+            timings = measure_latency(model, queries, args.repeats)
+            print(
+                f"{backend:<8} {threads or 'default':>7} {percentile(timings, 50):>8.2f} "
+                f"{percentile(timings, 95):>8.2f} {cosine.mean():>9.4f} {cosine.min():>8.4f} {overlap:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmark_index.py
+#
+# Compare approximate index types against the exact flat index:
+# build time, query latency and recall@k.
+#
+#   python benchmark_index.py                      # vectors from the built index
+#   python benchmark_index.py --synthetic 1000000  # random unit vectors
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.vector_index import DEFAULT_INDEX_PARAMS, apply_search_params, build_index, index_vectors
+
+
+def load_corpus_vectors():
+    from app.chunk_store import current_prefix
+    from app.rag import INDEX_PATH
+
+    index = faiss.read_index(f"{current_prefix(INDEX_PATH)}.index")
+    ids, vectors = index_vectors(index)
+    return vectors
+
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def sample_queries(vectors, count: int, seed: int = 1):
+    # Perturbed corpus vectors stand in for real queries.
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    queries = picks + 0.05 * rng.standard_normal(picks.shape).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(truth, found, k: int) -> float:
+    hits = sum(
+        len(set(t[:k]) & set(f[:k]))
+        for t, f in zip(truth, found)
+    )
+    return hits / (len(truth) * k)
+
+
+def time_search(index, queries, k: int):
+    # One query at a time, like the chat path.
+    start = time.perf_counter()
+    results = [index.search(queries[i:i + 1], k)[1][0] for i in range(len(queries))]
+    elapsed = time.perf_counter() - start
+    return np.array(results), elapsed / len(queries) * 1000
+
+
+def run(vectors, queries, k: int, configs):
+    flat = build_index(vectors, "flat", DEFAULT_INDEX_PARAMS)
+    truth, flat_ms = time_search(flat, queries, k)
+
+    print(f"corpus={len(vectors)} dim={vectors.shape[1]} queries={len(queries)} k={k}")
+    print(f"{'index':<10} {'settings':<28} {'build s':>8} {'ms/query':>9} {f'recall@{k}':>9}")
+    print(f"{'flat':<10} {'exact':<28} {'-':>8} {flat_ms:>9.3f} {1.0:>9.3f}")
+
+    for index_type, build_params, sweep_key, sweep_values in configs:
+        params = {**DEFAULT_INDEX_PARAMS, **build_params}
+
+        start = time.perf_counter()
+        try:
+            index = build_index(vectors, index_type, params)
+        except ValueError as e:
+            print(f"{index_type:<10} skipped: {e}")
+            continue
+        build_s = time.perf_counter() - start
+
+        for value in sweep_values:
+            apply_search_params(index, {sweep_key: value})
+            found, ms = time_search(index, queries, k)
+            settings = ", ".join(f"{key}={v}" for key, v in build_params.items())
+            settings = f"{settings}, {sweep_key}={value}" if settings else f"{sweep_key}={value}"
+            print(
+                f"{index_type:<10} {settings:<28} {build_s:>8.2f} {ms:>9.3f} "
+                f"{recall_at_k(truth, found, k):>9.3f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types against the flat index.")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of the built index")
+    parser.add_argument("--dim", type=int, default=384, help="dimension for --synthetic")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nlist", type=int, default=DEFAULT_INDEX_PARAMS["nlist"])
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_corpus_vectors()
+
+    queries = sample_queries(vectors, args.queries)
+
+    configs = [
+        ("ivf", {"nlist": args.nlist}, "nprobe", [1, 4, 16, 64]),
+        ("hnsw", {"hnsw_m": 32}, "ef_search", [16, 64, 256]),
+        ("ivfpq", {"nlist": args.nlist, "pq_m": 16}, "nprobe", [4, 16, 64]),
+    ]
+
+    run(vectors, queries, args.k, configs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,18 @@
 # build_index.py
+#
+# Incremental by default: only new or changed PDFs are embedded.
+# Pass --force to rebuild everything from scratch.
+
+import sys
 
 from app.rag import MedicalRAG
+from app.telemetry import configure_logging
+
 
-rag = MedicalRAG()
-rag.create_index()
+if __name__ == "__main__":
+    # The guard matters: PDF parsing runs in a process pool.
+    configure_logging(fmt="text")
+    rag = MedicalRAG()
+    rag.create_index(force="--force" in sys.argv[1:])
 
-print("Index created successfully.")
\ No newline at end of file
+    print("Index created successfully.")
@@ -0,0 +1,52 @@
+# compact_history.py
+#
+# One-off history compaction, e.g. from cron or before a backup:
+#
+#   python compact_history.py                   # archive sessions idle for HISTORY_IDLE_DAYS
+#   python compact_history.py --idle-days 7 --vacuum full
+#   python compact_history.py --enable-incremental-vacuum
+#
+# --enable-incremental-vacuum converts a database created before
+# auto_vacuum=INCREMENTAL was the default; it rewrites the whole file, so
+# run it while the server is stopped.
+
+import argparse
+import asyncio
+
+from app.config import HISTORY_COMPACT_BATCH, HISTORY_COMPRESS_LEVEL, HISTORY_IDLE_DAYS
+from app.database import init_db, set_auto_vacuum
+from app.retention import HistoryCompactor
+from app.telemetry import configure_logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle chat sessions and reclaim disk space.")
+    parser.add_argument("--idle-days", type=float, default=HISTORY_IDLE_DAYS)
+    parser.add_argument("--vacuum", choices=("incremental", "full", "off"), default="incremental")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    configure_logging(fmt="text")
+    init_db()
+
+    if args.enable_incremental_vacuum:
+        changed = set_auto_vacuum("INCREMENTAL")
+        print("auto_vacuum set to INCREMENTAL." if changed else "auto_vacuum already INCREMENTAL.")
+
+    compactor = HistoryCompactor(
+        idle_days=args.idle_days,
+        interval=0,
+        batch_size=HISTORY_COMPACT_BATCH,
+        compress_level=HISTORY_COMPRESS_LEVEL,
+        vacuum=args.vacuum,
+    )
+    result = asyncio.run(compactor.run_once())
+
+    print(
+        f"Archived {result['messages']} messages from {result['sessions']} sessions, "
+        f"freed {result['freed_bytes'] / 1024:.0f} KiB."
+    )
+
+
+if __name__ == "__main__":
+    main()
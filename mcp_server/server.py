@@ -1,13 +1,32 @@
+from typing import Optional
+
 from mcp.server.fastmcp import FastMCP
-from services.hospital_service import recommend_hospital
-from services.drug_service import get_drug_information
+from services.hospital_service import nearest_hospitals, recommend_hospital
+from services.drug_service import get_drug_information, get_drug_information_batch
 
 mcp = FastMCP("Medical Tools MCP Server")
 
 
 @mcp.tool()
-def recommend_hospital_tool(city: str, severity_level: str, specialist_type: str = None) -> dict:
-    return recommend_hospital(city, severity_level, specialist_type)
+def recommend_hospital_tool(
+    city: Optional[str] = None,
+    severity_level: Optional[str] = None,
+    specialist_type: Optional[str] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+) -> dict:
+    return recommend_hospital(city, severity_level, specialist_type, latitude, longitude)
+
+
+@mcp.tool()
+def nearest_hospitals_tool(
+    latitude: float,
+    longitude: float,
+    severity_level: Optional[str] = None,
+    specialist_type: Optional[str] = None,
+    k: int = 3,
+) -> dict:
+    return nearest_hospitals(latitude, longitude, severity_level, specialist_type, k)
 
 
 @mcp.tool()
@@ -15,5 +34,10 @@ def get_drug_information_tool(drug_name: str) -> dict:
     return get_drug_information(drug_name)
 
 
+@mcp.tool(name="get_drug_information_batch")
+def get_drug_information_batch_tool(drug_names: list[str]) -> dict:
+    return get_drug_information_batch(drug_names)
+
+
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
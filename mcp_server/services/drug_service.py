@@ -1,5 +1,8 @@
 import json
 import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "drugs.json")
 
@@ -7,5 +10,205 @@ with open(DATA_PATH, "r") as f:
     DRUG_DATABASE = json.load(f)
 
 
+# ---------------------------
+# Name Normalisation
+# ---------------------------
+
+# Strength and dosage-form words carry no identity: "Acetaminophen 500mg
+# tablet" and "acetaminophen" are the same drug.
+STRENGTH_PATTERN = re.compile(r"\b\d+(\.\d+)?\s*(mg|mcg|µg|g|ml|iu|%)?(?=\s|$)")
+FORM_WORDS = {
+    "tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules",
+    "syrup", "suspension", "injection", "inj", "drops", "cream", "ointment",
+    "gel", "oral", "er", "sr", "xr", "ds", "forte",
+}
+
+
+# Separators between the ingredients of a combination product
+# ("Paracetamol/Ibuprofen", "aspirin + clopidogrel", "X and Y",
+# "Aspirin-clopidogrel"). A hyphen only counts between two words of four
+# letters or more, so "Dolo-650" and "Co-trimoxazole" stay one name.
+COMBINATION_PATTERN = re.compile(
+    r"\s*(?:/|\+|&|,|\band\b|\bwith\b|(?<=[^\W\d_]{4})-(?=[^\W\d_]{4}))\s*"
+)
+
+
+def normalize_drug_name(name: str) -> str:
+    # "Dolo-650" is "dolo 650", not "dolo650".
+    text = name.casefold().replace("-", " ")
+    text = re.sub(r"[^\w%.\s]|\.(?!\d)", " ", text)
+    text = STRENGTH_PATTERN.sub(" ", text)
+    return " ".join(word for word in text.split() if word not in FORM_WORDS)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Levenshtein distance, giving up (returning limit + 1) once every
+    alignment already costs more than `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return previous[-1]
+
+
+def max_edits(name: str) -> int:
+    return 0 if len(name) <= 4 else 1
+
+
+def number_tokens(name: str) -> tuple:
+    """
+    Words containing a digit ("b12"); a typo match must keep them intact,
+    so "vitamin b1" never becomes "vitamin b12".
+    """
+    return tuple(word for word in name.split() if any(char.isdigit() for char in word))
+
+
+def trigrams(name: str):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ---------------------------
+# Drug Index
+# ---------------------------
+
+class DrugIndex:
+    """
+    Resolves free-text medication names to DRUG_DATABASE entries.
+
+    Built once at load time from each drug's name and its "aliases"
+    (synonyms, brand names). Lookups try, in order: the normalised name,
+    its word sub-phrases (longest first), then typo-tolerant matching over a
+    trigram index, accepting the closest name within max_edits() with the
+    same number tokens. Every step gives up rather than guess when it finds
+    more than one drug, and combination products ("X/Y", "X and Y") are not
+    resolved to a single ingredient.
+    """
+
+    # Fuzzy matching only edit-checks this many best trigram candidates.
+    CANDIDATES = 20
+
+    def __init__(self, database: dict):
+        self.database = database
+        self.names = {}  # normalised name or alias -> canonical drug name
+        self.by_trigram = defaultdict(set)
+
+        for drug_name, record in database.items():
+            for name in [drug_name] + record.get("aliases", []):
+                key = normalize_drug_name(name)
+                if key and key not in self.names:
+                    self.names[key] = drug_name
+                    for gram in trigrams(key):
+                        self.by_trigram[gram].add(key)
+
+    @staticmethod
+    def _only(matches):
+        """
+        The single drug in `matches`, or None if there are none or several.
+        """
+        matches = set(matches)
+        return matches.pop() if len(matches) == 1 else None
+
+    def _exact(self, key: str):
+        if key in self.names:
+            return self.names[key]
+
+        # Longest sub-phrases first; all phrases of one length are checked
+        # so "aspirin ecosprin x" is not mistaken for "aspirin x".
+        words = key.split()
+        for size in range(len(words) - 1, 0, -1):
+            found = {
+                self.names[phrase]
+                for start in range(len(words) - size + 1)
+                if (phrase := " ".join(words[start:start + size])) in self.names
+            }
+            if found:
+                return self._only(found)
+
+        return None
+
+    def _fuzzy(self, key: str):
+        limit = max_edits(key)
+        if limit == 0:
+            return None
+
+        overlap = Counter()
+        for gram in trigrams(key):
+            overlap.update(self.by_trigram.get(gram, ()))
+
+        numbers = number_tokens(key)
+        best, best_distance = set(), limit + 1
+        for candidate, _ in overlap.most_common(self.CANDIDATES):
+            if number_tokens(candidate) != numbers:
+                continue
+            distance = edit_distance(key, candidate, limit)
+            if distance > limit:
+                continue
+            if distance < best_distance:
+                best, best_distance = {self.names[candidate]}, distance
+            elif distance == best_distance:
+                best.add(self.names[candidate])
+
+        return self._only(best)
+
+    @staticmethod
+    def is_combination(name: str) -> bool:
+        parts = [part for part in COMBINATION_PATTERN.split(name.casefold()) if part.strip()]
+        return len(parts) > 1
+
+    @lru_cache(maxsize=4096)
+    def resolve(self, name: str):
+        """
+        Return the canonical DRUG_DATABASE name for `name`, or None.
+        """
+        key = normalize_drug_name(name)
+        if not key or self.is_combination(name):
+            return None
+
+        match = self._exact(key) or self._fuzzy(key)
+        if match:
+            return match
+
+        # Multi-word names: a single misspelt word ("asprin extra").
+        return self._only(filter(None, (self._fuzzy(word) for word in key.split())))
+
+
+INDEX = DrugIndex(DRUG_DATABASE)
+
+
 def get_drug_information(drug_name: str):
-    return DRUG_DATABASE.get(drug_name, {"error": "Drug not found"})
\ No newline at end of file
+    if INDEX.is_combination(drug_name):
+        return {"error": "Combination product: look up each ingredient separately"}
+
+    canonical = INDEX.resolve(drug_name)
+
+    if canonical is None:
+        return {"error": "Drug not found"}
+
+    return {"name": canonical, **DRUG_DATABASE[canonical]}
+
+
+def get_drug_information_batch(drug_names: list):
+    """
+    Resolve a list of names at once; results are keyed by the names as given.
+    """
+    return {
+        "results": {
+            drug_name: get_drug_information(drug_name)
+            for drug_name in dict.fromkeys(drug_names)
+        }
+    }
@@ -1,34 +1,266 @@
 import json
+import math
 import os
+from collections import defaultdict
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "hospitals.json")
+# Other names users give for cities (lowercase alias -> lowercase city);
+# the API server reads the same file for city detection.
+ALIASES_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "city_aliases.json")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+# Hospitals with coordinates are bucketed into square cells of this many
+# degrees (~28 km of latitude); nearest-neighbour search walks rings of
+# cells outwards from the user's cell.
+GRID_CELL_DEGREES = 0.25
+
+# Ranking: a hospital is scored by its distance plus these penalties, so a
+# slightly farther hospital with the right capabilities ranks first.
+SPECIALTY_PENALTY_KM = 15.0
+EMERGENCY_PENALTY_KM = 15.0
+
+DEFAULT_MAX_DISTANCE_KM = 100.0
 
 with open(DATA_PATH, "r") as f:
     HOSPITALS = json.load(f)
 
+with open(ALIASES_PATH, "r") as f:
+    CITY_ALIASES = json.load(f)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class HospitalIndex:
+    """
+    Lookup tables built once from hospitals.json.
+
+    Hospitals are stored once in `hospitals`; every index holds positions
+    into that list:
+      by_city           city name -> positions, in file order
+      by_specialty      specialty -> set of positions
+      emergency         positions with an emergency department
+      first_emergency   city -> first emergency-capable position
+      first_specialist  (city, specialty) -> first position offering it
+      grid              (lat cell, lon cell) -> positions with coordinates
+    """
+
+    def __init__(self, hospitals_by_city: dict, aliases: dict = CITY_ALIASES):
+        self.aliases = aliases
+        self.hospitals = []
+        self.coordinates = []
+        self.by_city = {}
+        self.by_specialty = defaultdict(set)
+        self.emergency = set()
+        self.first_emergency = {}
+        self.first_specialist = {}
+        self.grid = defaultdict(list)
+
+        for city, hospitals in hospitals_by_city.items():
+            city_key = _normalize(city)
+            positions = self.by_city.setdefault(city_key, [])
+
+            for hospital in hospitals:
+                pos = len(self.hospitals)
+                self.hospitals.append(hospital)
+                positions.append(pos)
+
+                for specialty in hospital.get("specialties", []):
+                    specialty = _normalize(specialty)
+                    self.by_specialty[specialty].add(pos)
+                    self.first_specialist.setdefault((city_key, specialty), pos)
+
+                if hospital.get("emergency_available"):
+                    self.emergency.add(pos)
+                    self.first_emergency.setdefault(city_key, pos)
+
+                lat, lon = hospital.get("latitude"), hospital.get("longitude")
+                if lat is None or lon is None:
+                    self.coordinates.append(None)
+                else:
+                    self.coordinates.append((float(lat), float(lon)))
+                    self.grid[self._cell(lat, lon)].append(pos)
+
+        cells = list(self.grid)
+        self._grid_bounds = (
+            min(c[0] for c in cells), max(c[0] for c in cells),
+            min(c[1] for c in cells), max(c[1] for c in cells),
+        ) if cells else None
+
+    @staticmethod
+    def _cell(lat: float, lon: float):
+        return (math.floor(lat / GRID_CELL_DEGREES), math.floor(lon / GRID_CELL_DEGREES))
+
+    def _city_key(self, city: str) -> str:
+        city_key = _normalize(city)
+        return self.aliases.get(city_key, city_key)
+
+    def recommend_in_city(self, city: str, severity_level: str = None, specialist_type: str = None):
+        city_key = self._city_key(city)
+        positions = self.by_city.get(city_key)
+
+        if not positions:
+            return None
+
+        # Emergency logic
+        if severity_level and severity_level.lower() == "emergency":
+            pos = self.first_emergency.get(city_key)
+            if pos is not None:
+                return self.hospitals[pos]
 
-def recommend_hospital(city: str, severity_level: str = None, specialist_type: str = None):
-    city_key = city.strip().lower()
+        # Specialist logic
+        if specialist_type:
+            pos = self.first_specialist.get((city_key, _normalize(specialist_type)))
+            if pos is not None:
+                return self.hospitals[pos]
 
-    # Normalize city keys
-    normalized_data = {k.lower(): v for k, v in HOSPITALS.items()}
+        return self.hospitals[positions[0]]
 
-    city_data = normalized_data.get(city_key)
+    def _ring(self, center, radius: int):
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        for dj in range(-radius, radius + 1):
+            yield (ci - radius, cj + dj)
+            yield (ci + radius, cj + dj)
+        for di in range(-radius + 1, radius):
+            yield (ci + di, cj - radius)
+            yield (ci + di, cj + radius)
 
-    if not city_data:
+    def _ring_min_km(self, latitude: float, radius: int) -> float:
+        # Lower bound on the distance to any point in a ring: (radius - 1)
+        # whole cells, measured along longitude at the ring's highest latitude,
+        # where a degree is shortest.
+        if radius <= 1:
+            return 0.0
+        widest_lat = min(89.0, abs(latitude) + (radius + 1) * GRID_CELL_DEGREES)
+        return (radius - 1) * GRID_CELL_DEGREES * KM_PER_DEGREE * math.cos(math.radians(widest_lat))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        severity_level: str = None,
+        specialist_type: str = None,
+        k: int = 3,
+        max_distance_km: float = DEFAULT_MAX_DISTANCE_KM,
+    ):
+        """
+        Return up to k (score, distance_km, position) tuples for the best
+        hospitals around a location, best first.
+
+        Emergency severity only considers hospitals with an emergency
+        department. Lacking the requested specialty, or an emergency
+        department for high severity, adds a distance penalty to the score.
+        """
+        if self._grid_bounds is None or k <= 0:
+            return []
+
+        severity = (severity_level or "").lower()
+        specialty_positions = (
+            self.by_specialty.get(_normalize(specialist_type), set()) if specialist_type else None
+        )
+
+        center = self._cell(latitude, longitude)
+        min_i, max_i, min_j, max_j = self._grid_bounds
+        last_ring = max(
+            abs(center[0] - min_i), abs(center[0] - max_i),
+            abs(center[1] - min_j), abs(center[1] - max_j),
+        )
+
+        found = []
+        for radius in range(last_ring + 1):
+            ring_min_km = self._ring_min_km(latitude, radius)
+            if max_distance_km is not None and ring_min_km > max_distance_km:
+                break
+            if len(found) >= k and ring_min_km > found[k - 1][0]:
+                break
+
+            for cell in self._ring(center, radius):
+                for pos in self.grid.get(cell, ()):
+                    if severity == "emergency" and pos not in self.emergency:
+                        continue
+
+                    lat, lon = self.coordinates[pos]
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if max_distance_km is not None and distance > max_distance_km:
+                        continue
+
+                    score = distance
+                    if specialty_positions is not None and pos not in specialty_positions:
+                        score += SPECIALTY_PENALTY_KM
+                    if severity == "high" and pos not in self.emergency:
+                        score += EMERGENCY_PENALTY_KM
+
+                    found.append((score, distance, pos))
+
+            found.sort()
+            del found[k:]
+
+        return found
+
+
+INDEX = HospitalIndex(HOSPITALS)
+
+
+def _with_distance(hospital: dict, distance: float) -> dict:
+    return {**hospital, "distance_km": round(distance, 1)}
+
+
+def nearest_hospitals(
+    latitude: float,
+    longitude: float,
+    severity_level: str = None,
+    specialist_type: str = None,
+    k: int = 3,
+    max_distance_km: float = DEFAULT_MAX_DISTANCE_KM,
+):
+    ranked = INDEX.nearest(latitude, longitude, severity_level, specialist_type, k, max_distance_km)
+
+    if not ranked:
+        return {"error": "No hospital found near this location"}
+
+    return {
+        "hospitals": [
+            _with_distance(INDEX.hospitals[pos], distance)
+            for _, distance, pos in ranked
+        ]
+    }
+
+
+def recommend_hospital(
+    city: str = None,
+    severity_level: str = None,
+    specialist_type: str = None,
+    latitude: float = None,
+    longitude: float = None,
+):
+    # A location beats the city name: rank by distance and capability.
+    if latitude is not None and longitude is not None:
+        ranked = INDEX.nearest(latitude, longitude, severity_level, specialist_type, k=1)
+        if ranked:
+            _, distance, pos = ranked[0]
+            return _with_distance(INDEX.hospitals[pos], distance)
+
+    if not city:
         return {"error": "City not found"}
 
-    # Emergency logic
-    if severity_level and severity_level.lower() == "emergency":
-        for hospital in city_data:
-            if hospital.get("emergency_available"):
-                return hospital
+    hospital = INDEX.recommend_in_city(city, severity_level, specialist_type)
 
-    # Specialist logic
-    if specialist_type:
-        specialist_type = specialist_type.strip().capitalize()
-        for hospital in city_data:
-            if specialist_type in hospital.get("specialties", []):
-                return hospital
+    if hospital is None:
+        return {"error": "City not found"}
 
-    return city_data[0]
+    return hospital